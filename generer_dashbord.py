@@ -11,278 +11,498 @@ Output:
     docs/index.html (legg denne i docs/ for GitHub Pages)
 """
 
+import os
+import gzip
+import base64
+import hashlib
 import pandas as pd
 import numpy as np
-import json
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pv
+from string import Template
 from datetime import datetime
 
+# Parquet-kopier av preprosesserte data, se cached_load()
+CACHE_DIR = "data/cache"
+
+# Interaktivt QGIS Cloud-kart over Asker sentrum
+KART_URL = "https://qgiscloud.com/jaleas/Asker_sentrum_cloud/?l=Til%20Asker%20sentrum%20Morgen%2CFra%20Asker%20sentrum%20Ettermiddag!%2CGjennomfart%20Asker%20Syd-Nord%20uE18!%2CGjennomfart%20Asker%20Syd-Nord%20!%2CGjennomfart%20Asker%20Syd-Vest%20!%2CGjennomfart%20Asker%20Syd-Vest%20uE18!%2CKart%20over%20koer!%2CAsker%20sentrum%5B43%5D%2CSoner%20Syd%20Vest%20og%20Nord%5B78%5D!%2CGrey&t=Asker_sentrum_cloud&e=1148232%2C8344108%2C1180532%2C8368683"
+
+# Seriene per strekning og tid på dagen i den innebygde koData, i denne rekkefølgen
+KO_VARIANTER = ["dato", "klokkeslett_raw", "klokkeslett"]
+
+# Kolonner i kødataene som brukes videre (resten av CSV-en droppes ved innlasting)
+KO_KOLONNER = ["dato", "klokkeslett", "stop_name", "tid_dag", "ko_min_km", "forsinkelser", "bil"]
+
+# Transportmiddel-kolonner i reisedataene
+REISEMIDLER = ["bil", "buss", "sykkel", "gange", "tog"]
+
+# Kolonner i nøkkeltalldataene som bygges inn i HTML-en
+NOKKEL_KOLONNER = ["delomrade_fra", "delomrade_til", "kvartal", "reiser", "co2_tonn", "time_of_day",
+                   "weekday_indicator"]
+
+# Oppløsning for klokkeslett-aggregeringene
+KLOKKESLETT_INTERVALL = "15min"
+
+# orjson-innstillinger for data som bygges inn i HTML-en
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def fast_ddmmyyyy(ts):
+    """Formater en datetime-serie som dd.mm.yyyy med vektoriserte strengoperasjoner"""
+    d = ts.dt
+    dag = np.char.zfill(d.day.to_numpy(dtype=float, na_value=0).astype(int).astype(str), 2)
+    maaned = np.char.zfill(d.month.to_numpy(dtype=float, na_value=0).astype(int).astype(str), 2)
+    aar = d.year.to_numpy(dtype=float, na_value=0).astype(int).astype(str)
+    dato_str = np.char.add(np.char.add(np.char.add(np.char.add(dag, "."), maaned), "."), aar)
+    return pd.Series(dato_str, index=ts.index, dtype=object).where(ts.notna())
+
+
+def read_csv_fast(filepath, tekstkolonner=()):
+    """Les semikolonseparert CSV med desimalkomma via pyarrows CSV-leser"""
+    tabell = pv.read_csv(
+        filepath,
+        parse_options=pv.ParseOptions(delimiter=";"),
+        convert_options=pv.ConvertOptions(
+            decimal_point=",",
+            strings_can_be_null=True,
+            column_types={col: pa.string() for col in tekstkolonner}
+        )
+    )
+    df = tabell.to_pandas()
+    df.columns = [col.lstrip("\ufeff").strip() for col in df.columns]
+    return df
+
+
+def coerce_numeric(df, cols):
+    """Gjør kolonner om til tall der CSV-leseren ikke allerede har typet dem (ugyldige verdier blir NaN)"""
+    for col in cols:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col].str.replace(",", ".", regex=False), errors="coerce")
+
+
+def parse_dato(s):
+    """Parse datoer med ett fast format, bestemt én gang fra første verdi (ISO eller dd.mm.åååå).
+    Datoer som ikke følger formatet gir feil, så en endret eller blandet eksport ikke forsvinner stille"""
+    gyldige = s.dropna()
+    fmt = "%d.%m.%Y" if len(gyldige) > 0 and "." in gyldige.iloc[0] else "%Y-%m-%d"
+    return pd.to_datetime(s, format=fmt, cache=True)
+
 
 def load_and_process_ko_data(filepath):
     """Last inn og preprosesser kødata"""
-    df = pd.read_csv(filepath, sep=";", decimal=",", encoding="utf-8-sig")
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    # dato og klokkeslett leses som tekst og parses med kjent format nedenfor
+    df = read_csv_fast(filepath, tekstkolonner=["dato", "klokkeslett"])
     df.columns = df.columns.str.lower()
+    # Bare kolonnene aggregeringen bruker tas med videre
+    df = df[[col for col in KO_KOLONNER if col in df.columns]]
 
-    df["dato"] = pd.to_datetime(df["dato"])
-    df["dato_str"] = df["dato"].dt.strftime("%d.%m.%Y")
+    df["dato"] = parse_dato(df["dato"])
+    # Formater bare de unike datoene, og lagre dato_str som kategori i kronologisk rekkefølge
+    dato_koder, unike_datoer = pd.factorize(df["dato"], sort=True)
+    df["dato_str"] = pd.Categorical.from_codes(dato_koder, categories=fast_ddmmyyyy(pd.Series(unike_datoer)))
 
-    df["forsinkelser"] = pd.to_numeric(df["forsinkelser"], errors="coerce")
-    df["ko_min_km"] = pd.to_numeric(df["ko_min_km"], errors="coerce")
-    df["bil"] = pd.to_numeric(df["bil"], errors="coerce")
+    # Klokkeslett grupperes i faste intervaller så grafene ikke får ett punkt per minutt. Eksporten kan
+    # gi HH:MM eller HH:MM:SS, så formatet bestemmes per verdi; verdier som ikke kan tolkes gir feil
+    klokke = pd.to_datetime(df["klokkeslett"], format="mixed", cache=True)
+    df["klokkeslett"] = klokke.dt.floor(KLOKKESLETT_INTERVALL).dt.strftime("%H:%M")
+
+    coerce_numeric(df, ["forsinkelser", "ko_min_km", "bil"])
+
+    # Vekter per rad for bilvektet snitt: bil teller bare der verdien finnes og bil > 0
+    gyldig_bil = df["bil"] > 0
+    df["bil_valid_ko"] = df["bil"].where(df["ko_min_km"].notna() & gyldig_bil, 0)
+    df["bil_valid_fors"] = df["bil"].where(df["forsinkelser"].notna() & gyldig_bil, 0)
+    df["w_ko"] = (df["ko_min_km"] * df["bil"]).where(df["bil_valid_ko"] > 0, 0)
+    df["w_fors"] = (df["forsinkelser"] * df["bil"]).where(df["bil_valid_fors"] > 0, 0)
+
+    # Sorter én gang slik at aggregeringene kan gruppere uten å sortere på nytt
+    df = df.sort_values(["stop_name", "tid_dag", "dato", "klokkeslett"], kind="mergesort").reset_index(drop=True)
+
+    # Få unike verdier: kategorier gir mindre minne og groupby på heltallskoder
+    for col in ["stop_name", "tid_dag", "klokkeslett"]:
+        df[col] = df[col].astype("category")
 
     return df
 
 
 def load_and_process_reiser_data(filepath):
     """Last inn og preprosesser reisedata"""
-    df = pd.read_csv(filepath, sep=";", decimal=",", encoding="utf-8-sig")
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    df = read_csv_fast(filepath, tekstkolonner=["kvartal"])
+    df = df[[col for col in ["ID", "kvartal"] + REISEMIDLER if col in df.columns]]
 
-    for col in ["bil", "buss", "sykkel", "gange", "tog"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    coerce_numeric(df, REISEMIDLER)
 
-    df["kvartal_sort"] = df["kvartal"].str.replace("-", "").astype(int)
-    df = df.sort_values("kvartal_sort").reset_index(drop=True)
+    df["kvartal_sort"] = pd.to_numeric(df["kvartal"].str.replace("-", "", regex=False), downcast="integer")
+    df = df.sort_values("kvartal_sort", kind="mergesort").reset_index(drop=True)
 
     return df
 
 
 def load_and_process_nokkel_data(filepath):
     """Last inn og preprosesser nøkkeltalldata"""
-    df = pd.read_csv(filepath, sep=";", decimal=",", encoding="utf-8-sig")
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    df = read_csv_fast(filepath, tekstkolonner=["delomrade_fra", "delomrade_til", "kvartal"])
+    df = df[[col for col in NOKKEL_KOLONNER if col in df.columns]]
 
     # Behandle delområder som string
     df["delomrade_fra"] = df["delomrade_fra"].astype(str).str.strip()
     df["delomrade_til"] = df["delomrade_til"].astype(str).str.strip()
 
-    df["reiser"] = pd.to_numeric(df["reiser"], errors="coerce")
-    df["co2_tonn"] = pd.to_numeric(df["co2_tonn"], errors="coerce")
+    coerce_numeric(df, ["reiser", "co2_tonn"])
 
     # Lag sorteringsnøkkel for kvartal
-    df["kvartal_sort"] = df["kvartal"].str.replace("-", "").astype(int)
+    df["kvartal_sort"] = pd.to_numeric(df["kvartal"].str.replace("-", "", regex=False), downcast="integer")
+
+    # Sorter én gang ved innlasting; prepare_nokkel_data kan da lese unike verdier i rekkefølge
+    df = df.sort_values(["delomrade_fra", "delomrade_til", "kvartal_sort"], kind="mergesort").reset_index(drop=True)
 
     return df
 
 
-def aggregate_ko_data(df):
-    """Aggreger kødata for grafer"""
+def cached_load(csv_path, loader_fn):
+    """Last data via loader_fn, eller fra Parquet-cache hvis CSV-en og scriptet er uendret"""
+    navn = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(CACHE_DIR, f"{navn}.parquet")
+    stamp_path = os.path.join(CACHE_DIR, f"{navn}.stamp")
+    stamp = f"{os.stat(csv_path).st_mtime_ns}:{os.stat(__file__).st_mtime_ns}"
+
+    if os.path.exists(cache_path) and os.path.exists(stamp_path):
+        with open(stamp_path, encoding="utf-8") as f:
+            if f.read() == stamp:
+                return pd.read_parquet(cache_path)
+
+    df = loader_fn(csv_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_parquet(cache_path, index=False)
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        f.write(stamp)
+    return df
+
+
+def pack_json(data):
+    """Serialiser til JSON, gzip-komprimer og base64-kod for innbygging i HTML"""
+    return base64.b64encode(gzip.compress(orjson.dumps(data, option=JSON_OPTIONS), 6))
+
+
+def pack_kolonner(kolonner, delta=()):
+    """Pakk NumPy-kolonner som én gzip-komprimert binærblob (base64) og en oversikt over type, start og
+    lengde per kolonne. Kolonnene i delta lagres som differanser til forrige verdi (JS summerer opp)."""
+    oversikt, biter, start = {}, [], 0
+    for navn, verdier in kolonner.items():
+        if navn in delta:
+            verdier = np.diff(verdier, prepend=verdier.dtype.type(0))
+        data = verdier.astype(verdier.dtype.newbyteorder("<"), copy=False).tobytes()
+        oversikt[navn] = {"type": verdier.dtype.name, "start": start, "lengde": len(verdier), "delta": navn in delta}
+        biter.append(data)
+        start += len(data)
+    return oversikt, base64.b64encode(gzip.compress(b"".join(biter), 6))
+
+
+def round_array(s, n=3):
+    """Rund av en serie til n desimaler som NumPy-array (orjson skriver NaN som null)"""
+    return np.round(s.to_numpy(dtype=float), n)
+
+
+def group_codes(df, keys):
+    """Felles heltallskode per gruppe for én eller flere nøkkelkolonner, i sortert rekkefølge.
+    Returnerer radmaske (rader uten manglende nøkler), gruppekode per gyldig rad og nøkkelverdiene per gruppe."""
+    koder, nivaer = [], []
+    for key in keys:
+        kode, unike = pd.factorize(df[key], sort=True)
+        koder.append(kode)
+        nivaer.append(unike)
+
+    gyldig = np.logical_and.reduce([kode >= 0 for kode in koder])
+    form = [len(unike) for unike in nivaer]
+    felles = np.ravel_multi_index([kode[gyldig] for kode in koder], form)
+
+    # Bare observerte kombinasjoner; np.unique sorterer, så gruppene kommer i nøkkelrekkefølge
+    observerte, gruppe = np.unique(felles, return_inverse=True)
+    nokler = pd.DataFrame({
+        key: unike[idx] for key, unike, idx in zip(keys, nivaer, np.unravel_index(observerte, form))
+    })
+    return gyldig, gruppe, nokler
+
+
+def weighted_avg(df, keys):
+    """Bilvektet snitt av kø og forsinkelser per gruppe, fra vektkolonnene i load_and_process_ko_data"""
+    keys = [keys] if isinstance(keys, str) else keys
+    gyldig, gruppe, nokler = group_codes(df, keys)
+
+    # np.bincount summerer vektene per gruppekode; grupper uten gyldige biler gir 0/0 = NaN
+    def sum_per_gruppe(col):
+        return np.bincount(gruppe, weights=df[col].to_numpy()[gyldig], minlength=len(nokler))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        nokler["ko_min_km"] = sum_per_gruppe("w_ko") / sum_per_gruppe("bil_valid_ko")
+        nokler["forsinkelser"] = sum_per_gruppe("w_fors") / sum_per_gruppe("bil_valid_fors")
+    return nokler
+
+
+def median_per_group(df, keys, verdier):
+    """Median per gruppe for hver verdikolonne (NaN ignoreres), via sortering innen gruppekodene"""
+    gyldig, gruppe, nokler = group_codes(df, keys)
+    antall_grupper = len(nokler)
+
+    for col in verdier:
+        verdi = df[col].to_numpy(dtype=float)[gyldig]
+        har_verdi = ~np.isnan(verdi)
+        g, v = gruppe[har_verdi], verdi[har_verdi]
+
+        # Sorter på gruppe og deretter verdi; hver gruppe blir et sammenhengende, sortert intervall
+        rekkefolge = np.lexsort((v, g))
+        v = v[rekkefolge]
+        antall = np.bincount(g, minlength=antall_grupper)
+        start = np.cumsum(antall) - antall
+
+        median = np.full(antall_grupper, np.nan)
+        med = antall > 0
+        nedre = start[med] + (antall[med] - 1) // 2
+        ovre = start[med] + antall[med] // 2
+        median[med] = (v[nedre] + v[ovre]) / 2
+        nokler[col] = median
+
+    return nokler
+
+
+def slices_per_stop(agg):
+    """Finn sammenhengende radintervaller per strekning i en aggregering sortert på stop_name"""
+    stops = agg["stop_name"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, stops[1:] != stops[:-1]]) if len(stops) > 0 else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(stops)]
+    return {stops[start]: slice(start, end) for start, end in zip(starts, ends)}
+
+
+def aggregate_ko_tid_dag(df_tid):
+    """Aggreger kødata for én tid på dagen, som {strekning: [serie per variant i KO_VARIANTER]}"""
     aggregated = {}
 
-    for tid_dag in ["Morgen", "Ettermiddag"]:
-        df_tid = df[df["tid_dag"] == tid_dag].copy()
-
-        if len(df_tid) == 0:
-            continue
-
-        def weighted_avg_ko(group):
-            mask = group["ko_min_km"].notna() & group["bil"].notna() & (group["bil"] > 0)
-            if mask.sum() == 0:
-                return np.nan
-            return (group.loc[mask, "ko_min_km"] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-        def weighted_avg_forsinkelser(group):
-            mask = group["forsinkelser"].notna() & group["bil"].notna() & (group["bil"] > 0)
-            if mask.sum() == 0:
-                return np.nan
-            return (group.loc[mask, "forsinkelser"] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-        agg_alle_dato = df_tid.groupby("dato").apply(
-            lambda g: pd.Series({
-                "ko_min_km": weighted_avg_ko(g),
-                "forsinkelser": weighted_avg_forsinkelser(g)
-            }), include_groups=False
-        ).reset_index()
-        agg_alle_dato = agg_alle_dato.sort_values("dato")
-        agg_alle_dato["dato_str"] = agg_alle_dato["dato"].dt.strftime("%d.%m.%Y")
-        agg_alle_dato["dato_iso"] = agg_alle_dato["dato"].dt.strftime("%Y-%m-%d")
-
-        key = f"Alle strekninger_{tid_dag}"
-        aggregated[key] = {
-            "datoer": agg_alle_dato["dato_str"].tolist(),
-            "datoer_iso": agg_alle_dato["dato_iso"].tolist(),
-            "ko": [round(x, 3) if pd.notna(x) else None for x in agg_alle_dato["ko_min_km"].tolist()],
-            "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_alle_dato["forsinkelser"].tolist()]
-        }
-
-        # Klokkeslett-data med dato for filtrering (rådata per dato og klokkeslett)
-        agg_alle_klokke_dato = df_tid.groupby(["dato", "klokkeslett"]).apply(
-            lambda g: pd.Series({
-                "ko_min_km": weighted_avg_ko(g),
-                "forsinkelser": weighted_avg_forsinkelser(g)
-            }), include_groups=False
-        ).reset_index()
-        agg_alle_klokke_dato["dato_iso"] = agg_alle_klokke_dato["dato"].dt.strftime("%Y-%m-%d")
-
-        key = f"Alle strekninger_{tid_dag}_klokkeslett_raw"
-        aggregated[key] = {
-            "records": [
-                {
-                    "dato_iso": row["dato_iso"],
-                    "klokkeslett": row["klokkeslett"],
-                    "ko": round(row["ko_min_km"], 3) if pd.notna(row["ko_min_km"]) else None,
-                    "forsinkelser": round(row["forsinkelser"], 3) if pd.notna(row["forsinkelser"]) else None
-                }
-                for _, row in agg_alle_klokke_dato.iterrows()
-            ]
-        }
+    if len(df_tid) == 0:
+        return aggregated
 
-        # Beholder også pre-aggregert for bakoverkompatibilitet
-        agg_alle_klokke = df_tid.groupby("klokkeslett").apply(
-            lambda g: pd.Series({
-                "ko_min_km": weighted_avg_ko(g),
-                "forsinkelser": weighted_avg_forsinkelser(g)
-            }), include_groups=False
-        ).reset_index()
-        agg_alle_klokke = agg_alle_klokke.sort_values("klokkeslett")
-
-        key = f"Alle strekninger_{tid_dag}_klokkeslett"
-        aggregated[key] = {
-            "klokkeslett": agg_alle_klokke["klokkeslett"].tolist(),
-            "ko": [round(x, 3) if pd.notna(x) else None for x in agg_alle_klokke["ko_min_km"].tolist()],
-            "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_alle_klokke["forsinkelser"].tolist()]
-        }
-
-        for stop in df_tid["stop_name"].dropna().unique():
-            df_stop = df_tid[df_tid["stop_name"] == stop]
-
-            agg = df_stop.groupby(["dato", "dato_str"]).agg({
-                "ko_min_km": "median",
-                "forsinkelser": "median"
-            }).reset_index()
-            agg = agg.sort_values("dato")
-            agg["dato_iso"] = agg["dato"].dt.strftime("%Y-%m-%d")
-
-            key = f"{stop}_{tid_dag}"
-            aggregated[key] = {
-                "datoer": agg["dato_str"].tolist(),
-                "datoer_iso": agg["dato_iso"].tolist(),
-                "ko": [round(x, 3) if pd.notna(x) else None for x in agg["ko_min_km"].tolist()],
-                "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg["forsinkelser"].tolist()]
-            }
+    agg_alle_dato = weighted_avg(df_tid, "dato")
+    agg_alle_dato["dato_str"] = fast_ddmmyyyy(agg_alle_dato["dato"])
+    agg_alle_dato["dato_iso"] = agg_alle_dato["dato"].dt.strftime("%Y-%m-%d")
 
-            # Klokkeslett-data med dato for filtrering
-            agg_klokke_dato = df_stop.groupby(["dato", "klokkeslett"]).agg({
-                "ko_min_km": "median",
-                "forsinkelser": "median"
-            }).reset_index()
-            agg_klokke_dato["dato_iso"] = agg_klokke_dato["dato"].dt.strftime("%Y-%m-%d")
-
-            key = f"{stop}_{tid_dag}_klokkeslett_raw"
-            aggregated[key] = {
-                "records": [
-                    {
-                        "dato_iso": row["dato_iso"],
-                        "klokkeslett": row["klokkeslett"],
-                        "ko": round(row["ko_min_km"], 3) if pd.notna(row["ko_min_km"]) else None,
-                        "forsinkelser": round(row["forsinkelser"], 3) if pd.notna(row["forsinkelser"]) else None
-                    }
-                    for _, row in agg_klokke_dato.iterrows()
-                ]
-            }
+    alle_dato = {
+        "datoer": agg_alle_dato["dato_str"].tolist(),
+        "datoer_iso": agg_alle_dato["dato_iso"].tolist(),
+        "ko": round_array(agg_alle_dato["ko_min_km"]),
+        "forsinkelser": round_array(agg_alle_dato["forsinkelser"])
+    }
+
+    # Klokkeslett-data med dato for filtrering (rådata per dato og klokkeslett)
+    agg_alle_klokke_dato = weighted_avg(df_tid, ["dato", "klokkeslett"])
+    agg_alle_klokke_dato["dato_iso"] = agg_alle_klokke_dato["dato"].dt.strftime("%Y-%m-%d")
+
+    alle_klokke_dato = {
+        "records": [
+            {"dato_iso": dato_iso, "klokkeslett": klokkeslett, "ko": ko, "forsinkelser": forsinkelser}
+            for dato_iso, klokkeslett, ko, forsinkelser in zip(
+                agg_alle_klokke_dato["dato_iso"].tolist(),
+                agg_alle_klokke_dato["klokkeslett"].tolist(),
+                round_array(agg_alle_klokke_dato["ko_min_km"]).tolist(),
+                round_array(agg_alle_klokke_dato["forsinkelser"]).tolist()
+            )
+        ]
+    }
+
+    # Beholder også pre-aggregert for bakoverkompatibilitet
+    agg_alle_klokke = weighted_avg(df_tid, "klokkeslett")
 
-            agg_klokke = df_stop.groupby("klokkeslett").agg({
-                "ko_min_km": "median",
-                "forsinkelser": "median"
-            }).reset_index()
-            agg_klokke = agg_klokke.sort_values("klokkeslett")
-
-            key = f"{stop}_{tid_dag}_klokkeslett"
-            aggregated[key] = {
-                "klokkeslett": agg_klokke["klokkeslett"].tolist(),
-                "ko": [round(x, 3) if pd.notna(x) else None for x in agg_klokke["ko_min_km"].tolist()],
-                "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_klokke["forsinkelser"].tolist()]
+    alle_klokke = {
+        "klokkeslett": agg_alle_klokke["klokkeslett"].tolist(),
+        "ko": round_array(agg_alle_klokke["ko_min_km"]),
+        "forsinkelser": round_array(agg_alle_klokke["forsinkelser"])
+    }
+    aggregated["Alle strekninger"] = [alle_dato, alle_klokke_dato, alle_klokke]
+
+    # Én median-aggregering for alle strekninger (sortert på strekning først). Resultatene
+    # formateres én gang, og deles deretter i sammenhengende skiver per strekning.
+    verdier = ["ko_min_km", "forsinkelser"]
+    med_dato = median_per_group(df_tid, ["stop_name", "dato", "dato_str"], verdier)
+    med_klokke_dato = median_per_group(df_tid, ["stop_name", "dato", "klokkeslett"], verdier)
+    med_klokke = median_per_group(df_tid, ["stop_name", "klokkeslett"], verdier)
+
+    dato_datoer = med_dato["dato_str"].tolist()
+    dato_datoer_iso = med_dato["dato"].dt.strftime("%Y-%m-%d").tolist()
+    dato_ko = round_array(med_dato["ko_min_km"])
+    dato_fors = round_array(med_dato["forsinkelser"])
+
+    klokke_dato_records = [
+        {"dato_iso": dato_iso, "klokkeslett": klokkeslett, "ko": ko, "forsinkelser": forsinkelser}
+        for dato_iso, klokkeslett, ko, forsinkelser in zip(
+            med_klokke_dato["dato"].dt.strftime("%Y-%m-%d").tolist(),
+            med_klokke_dato["klokkeslett"].tolist(),
+            round_array(med_klokke_dato["ko_min_km"]).tolist(),
+            round_array(med_klokke_dato["forsinkelser"]).tolist()
+        )
+    ]
+
+    klokke_klokkeslett = med_klokke["klokkeslett"].tolist()
+    klokke_ko = round_array(med_klokke["ko_min_km"])
+    klokke_fors = round_array(med_klokke["forsinkelser"])
+
+    skiver_dato = slices_per_stop(med_dato)
+    skiver_klokke_dato = slices_per_stop(med_klokke_dato)
+    skiver_klokke = slices_per_stop(med_klokke)
+
+    # Hver strekning med data i minst én av aggregeringene får alle tre seriene; mangler den
+    # gyldige verdier i en aggregering, blir den serien tom
+    tom = slice(0, 0)
+    for stop in sorted(skiver_dato.keys() | skiver_klokke_dato.keys() | skiver_klokke.keys()):
+        sl = skiver_dato.get(stop, tom)
+        sl_klokke = skiver_klokke.get(stop, tom)
+        aggregated[stop] = [
+            {
+                "datoer": dato_datoer[sl],
+                "datoer_iso": dato_datoer_iso[sl],
+                "ko": dato_ko[sl],
+                "forsinkelser": dato_fors[sl]
+            },
+            # Klokkeslett-data med dato for filtrering
+            {"records": klokke_dato_records[skiver_klokke_dato.get(stop, tom)]},
+            {
+                "klokkeslett": klokke_klokkeslett[sl_klokke],
+                "ko": klokke_ko[sl_klokke],
+                "forsinkelser": klokke_fors[sl_klokke]
             }
+        ]
 
     return aggregated
 
 
+def aggregate_ko_data(df):
+    """Aggreger kødata for grafer (forventer data sortert som i load_and_process_ko_data).
+
+    Resultatet er indeksert i stedet for å bruke sammensatte strengnøkler:
+    serier[strekning_idx][tid_idx][variant_idx] er en serie, eller None hvis det ikke finnes data."""
+    tider = ["Morgen", "Ettermiddag"]
+
+    delresultater = [aggregate_ko_tid_dag(df[df["tid_dag"] == tid_dag]) for tid_dag in tider]
+
+    stops = sorted({stop for delresultat in delresultater for stop in delresultat} - {"Alle strekninger"})
+    strekninger = ["Alle strekninger"] + stops
+
+    return {
+        "strekninger": strekninger,
+        "tider": tider,
+        "varianter": KO_VARIANTER,
+        "serier": [[delresultat.get(strekning) for delresultat in delresultater] for strekning in strekninger]
+    }
+
+
 def calculate_first_dates(ko_aggregated):
     """Beregn første dato med data for kø og forsinkelser"""
     first_ko_date = None
     first_forsinkelser_date = None
 
-    # Sjekk alle datasett for å finne første dato med faktisk data
-    for key, data in ko_aggregated.items():
-        if '_klokkeslett' in key or 'datoer_iso' not in data:
-            continue
+    # Sjekk alle dato-serier for å finne første dato med faktisk data
+    dato_idx = ko_aggregated["varianter"].index("dato")
+    for per_tid in ko_aggregated["serier"]:
+        for serie in per_tid:
+            if serie is None:
+                continue
 
-        datoer_iso = data['datoer_iso']
-        ko_values = data['ko']
-        forsinkelser_values = data['forsinkelser']
+            data = serie[dato_idx]
+            datoer_iso = data['datoer_iso']
 
-        # Finn første dato med kø-data
-        for i, (dato, ko) in enumerate(zip(datoer_iso, ko_values)):
-            if ko is not None:
+            # Finn første dato med kø-data (verdiene er NumPy-arrays med NaN der data mangler)
+            med_ko = np.flatnonzero(~np.isnan(data['ko']))
+            if len(med_ko) > 0:
+                dato = datoer_iso[med_ko[0]]
                 if first_ko_date is None or dato < first_ko_date:
                     first_ko_date = dato
-                break
 
-        # Finn første dato med forsinkelser-data
-        for i, (dato, fors) in enumerate(zip(datoer_iso, forsinkelser_values)):
-            if fors is not None:
+            # Finn første dato med forsinkelser-data
+            med_fors = np.flatnonzero(~np.isnan(data['forsinkelser']))
+            if len(med_fors) > 0:
+                dato = datoer_iso[med_fors[0]]
                 if first_forsinkelser_date is None or dato < first_forsinkelser_date:
                     first_forsinkelser_date = dato
-                break
 
     return first_ko_date, first_forsinkelser_date
 
 
+def topp_strommer(summer, finnes, antall=10):
+    """Topp strømmer per rad i summer som [[kolonneindeks, reiser], ...]"""
+    topp = []
+    for rad, finnes_rad in zip(summer, finnes):
+        kolonner = np.flatnonzero(finnes_rad)
+        kolonner = kolonner[np.argsort(-rad[kolonner], kind="stable")][:antall]
+        topp.append([[int(k), float(rad[k])] for k in kolonner])
+    return topp
+
+
 def prepare_nokkel_data(df):
-    """Forbered nøkkeltalldata for JavaScript"""
-    # Lag liste over unike verdier
-    omrader_fra = sorted(df["delomrade_fra"].unique().tolist())
+    """Forbered nøkkeltalldata for JavaScript (forventer data sortert som i load_and_process_nokkel_data)"""
+    # Lag liste over unike verdier. delomrade_fra er allerede sortert; de andre er bare
+    # sortert innenfor hvert område, så der sorteres de få unike verdiene
+    omrader_fra = df["delomrade_fra"].unique().tolist()
     omrader_til = sorted(df["delomrade_til"].unique().tolist())
     tider = sorted(df["time_of_day"].unique().tolist())
-    kvartaler = df.sort_values("kvartal_sort")["kvartal"].unique().tolist()
+    ukedager = sorted(df["weekday_indicator"].unique().tolist())
+    kvartaler = df.drop_duplicates("kvartal_sort").sort_values("kvartal_sort")["kvartal"].tolist()
+
+    # Kategorikolonnene sendes som heltallskoder inn i listene over, tallkolonnene som flyttall
+    # (manglende verdier som 0). generate_html pakker dem binært med pack_kolonner. Trend beregnes i JS.
+    def koder(col, kategorier):
+        return pd.Categorical(df[col], categories=kategorier).codes.astype(np.int16)
+
+    fra_kode = koder("delomrade_fra", omrader_fra)
+    til_kode = koder("delomrade_til", omrader_til)
+    kvartal_kode = koder("kvartal", kvartaler)
+    kolonner = {
+        "fra": fra_kode,
+        "til": til_kode,
+        "kvartal": kvartal_kode,
+        "tid": koder("time_of_day", tider),
+        "ukedag": koder("weekday_indicator", ukedager),
+        "reiser": df["reiser"].fillna(0).to_numpy(dtype=np.float64),
+        "co2": df["co2_tonn"].fillna(0).to_numpy(dtype=np.float64)
+    }
+
+    # Radene er sortert på (fra, til), så hver kombinasjon er en sammenhengende blokk.
+    # Radene for fra-område i og til-område j er blokk_start[k]..blokk_start[k + 1] med
+    # k = i * len(omrader_til) + j; JS leser da bare blokkene for de valgte områdene.
+    blokk = fra_kode.astype(np.int64) * len(omrader_til) + til_kode
+    antall = np.bincount(blokk, minlength=len(omrader_fra) * len(omrader_til))
+    blokk_start = np.concatenate([[0], np.cumsum(antall)])
+
+    # Standardvisningen (alle områder, tider og ukedager) summeres per kvartal her. bincount legger sammen i
+    # radrekkefølge, akkurat som JS, så summene blir de samme som om de var beregnet i nettleseren.
+    standard = {
+        "reiser": np.bincount(kvartal_kode, weights=kolonner["reiser"], minlength=len(kvartaler)),
+        "co2": np.bincount(kvartal_kode, weights=kolonner["co2"], minlength=len(kvartaler)),
+        "funnet": np.bincount(kvartal_kode, minlength=len(kvartaler)) > 0
+    }
 
-    # Konverter hele datasettet til liste av dicts for JavaScript (uten trend - beregnes i JS)
-    records = df[
-        ["delomrade_fra", "delomrade_til", "kvartal", "reiser", "co2_tonn", "time_of_day",
-         "weekday_indicator"]].to_dict(
-        "records")
+    # Sankey: reiser per (fra, til) for de siste 4 kvartalene (uavhengig av tid/ukedag), og topp 10
+    # strømmer per område i hver retning. Topp 10 for et utvalg områder ligger alltid blant disse.
+    form = (len(omrader_fra), len(omrader_til))
+    siste = kvartal_kode >= len(kvartaler) - 4
+    summer = np.bincount(blokk[siste], weights=kolonner["reiser"][siste],
+                         minlength=antall.size).reshape(form)
+    finnes = np.bincount(blokk[siste], minlength=antall.size).reshape(form) > 0
 
     return {
-        "records": records,
+        "kolonner": kolonner,
+        "n": len(df),
+        "blokk_start": blokk_start,
         "omrader_fra": omrader_fra,
         "omrader_til": omrader_til,
         "tider": tider,
-        "kvartaler": kvartaler
+        "ukedager": ukedager,
+        "kvartaler": kvartaler,
+        "standard": standard,
+        "sankey_fra": topp_strommer(summer, finnes),
+        "sankey_til": topp_strommer(summer.T, finnes.T)
     }
 
 
-def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_date, first_forsinkelser_date):
-    """Generer HTML med embedded data og JavaScript"""
-
-    strekninger_ko = ["Alle strekninger"] + sorted(ko_data["stop_name"].dropna().unique().tolist())
-    strekninger_reiser = sorted(reiser_data["ID"].unique().tolist())
-
-    # Forbered reisedata som dict
-    reiser_dict = {}
-    for strekning in strekninger_reiser:
-        df_s = reiser_data[reiser_data["ID"] == strekning].sort_values("kvartal_sort")
-        reiser_dict[strekning] = {
-            "kvartaler": df_s["kvartal"].tolist(),
-            "bil": [round(x, 2) if pd.notna(x) else None for x in df_s["bil"].tolist()],
-            "buss": [round(x, 2) if pd.notna(x) else None for x in df_s["buss"].tolist()],
-            "sykkel": [round(x, 2) if pd.notna(x) else None for x in df_s["sykkel"].tolist()],
-            "gange": [round(x, 2) if pd.notna(x) else None for x in df_s["gange"].tolist()],
-            "tog": [round(x, 2) if pd.notna(x) else None for x in df_s["tog"].tolist()]
-        }
-
-    # Generer options for flervalg
-    omrade_fra_options = '<option value="Alle" selected>Alle</option>\n' + \
-                         "\n".join(f'<option value="{o}">{o}</option>' for o in nokkel_data["omrader_fra"])
-    omrade_til_options = '<option value="Alle" selected>Alle</option>\n' + \
-                         "\n".join(f'<option value="{o}">{o}</option>' for o in nokkel_data["omrader_til"])
-
-    # Generer radiobuttons for tid på dagen
-    tid_radios = '<label><input type="radio" name="tid-nokkel" value="Alle" checked onchange="updateNokkelChart()"> Alle</label>\n'
-    for tid in sorted(nokkel_data["tider"]):
-        tid_radios += f'<label><input type="radio" name="tid-nokkel" value="{tid}" onchange="updateNokkelChart()"> {tid}</label>\n'
-
-    html = f'''<!DOCTYPE html>
+# HTML-mal for dashbordet. Dataene settes inn mellom HTML_HEAD og HTML_TAIL i generate_html()
+HTML_HEAD = Template('''<!DOCTYPE html>
 <html lang="no">
 <head>
     <meta charset="UTF-8">
@@ -290,28 +510,28 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
     <title>Mobilitetsdashbord - Asker</title>
     <script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
-        body {{
+        }
+        body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
             background-color: #f5f5f5;
-        }}
-        .header {{
+        }
+        .header {
             background-color: #2c5f7c;
             color: white;
             padding: 20px;
             text-align: center;
-        }}
-        .nav {{
+        }
+        .nav {
             display: flex;
             gap: 0;
             background-color: #6b7b8c;
             padding: 0;
-        }}
-        .nav button {{
+        }
+        .nav button {
             background-color: #6b7b8c;
             color: white;
             border: none;
@@ -319,67 +539,67 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             cursor: pointer;
             font-size: 16px;
             transition: background-color 0.2s;
-        }}
-        .nav button:hover {{
+        }
+        .nav button:hover {
             background-color: #5a6a7a;
-        }}
-        .nav button.active {{
+        }
+        .nav button.active {
             background-color: #4a5a6a;
-        }}
-        .container {{
+        }
+        .container {
             display: flex;
             min-height: calc(100vh - 120px);
-        }}
-        .sidebar {{
+        }
+        .sidebar {
             width: 280px;
             background-color: #e8e8e8;
             padding: 20px;
             flex-shrink: 0;
-        }}
-        .sidebar h3 {{
+        }
+        .sidebar h3 {
             background-color: #2c5f7c;
             color: white;
             padding: 15px;
             margin: -20px -20px 20px -20px;
-        }}
-        .sidebar label {{
+        }
+        .sidebar label {
             display: block;
             margin-top: 15px;
             font-weight: bold;
-        }}
-        .sidebar select, .sidebar input {{
+        }
+        .sidebar select, .sidebar input {
             width: 100%;
             padding: 8px;
             margin-top: 5px;
             border: 1px solid #ccc;
             border-radius: 4px;
-        }}
-        .sidebar select[multiple] {{
+        }
+        .sidebar select[multiple] {
             height: 150px;
-        }}
-        .sidebar hr {{
+        }
+        .sidebar hr {
             margin: 20px 0;
             border: none;
             border-top: 1px solid #ccc;
-        }}
-        .main {{
+        }
+        .main {
             flex: 1;
             padding: 30px;
-        }}
-        .page {{
+        }
+        .page {
             display: none;
-        }}
-        .page.active {{
+        }
+        .page.active {
             display: block;
-        }}
-        .chart {{
+        }
+        .chart {
             background: white;
             padding: 20px;
             border-radius: 8px;
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
             margin-bottom: 20px;
-        }}
-        .sankey-btn {{
+        }
+        .sankey-btn {
             background-color: #2c5f7c;
             color: white;
             border: none;
@@ -388,16 +608,16 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             cursor: pointer;
             font-size: 14px;
             margin-top: 10px;
-        }}
-        .sankey-btn:hover {{
+        }
+        .sankey-btn:hover {
             background-color: #1e4a5f;
-        }}
-        .chart-buttons {{
+        }
+        .chart-buttons {
             display: flex;
             gap: 10px;
             margin-top: 10px;
-        }}
-        .modal {{
+        }
+        .modal {
             display: none;
             position: fixed;
             z-index: 1000;
@@ -406,8 +626,8 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             width: 100%;
             height: 100%;
             background-color: rgba(0,0,0,0.5);
-        }}
-        .modal-content {{
+        }
+        .modal-content {
             background-color: white;
             margin: 2% auto;
             padding: 20px;
@@ -416,74 +636,74 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             max-width: 1100px;
             max-height: 90vh;
             overflow-y: auto;
-        }}
-        .modal-header {{
+        }
+        .modal-header {
             display: flex;
             justify-content: space-between;
             align-items: center;
             margin-bottom: 15px;
             padding-bottom: 10px;
             border-bottom: 1px solid #eee;
-        }}
-        .modal-header h2 {{
+        }
+        .modal-header h2 {
             margin: 0;
             color: #2c5f7c;
-        }}
-        .modal-close {{
+        }
+        .modal-close {
             font-size: 28px;
             cursor: pointer;
             color: #666;
-        }}
-        .modal-close:hover {{
+        }
+        .modal-close:hover {
             color: #333;
-        }}
-        .sankey-controls {{
+        }
+        .sankey-controls {
             display: flex;
             gap: 20px;
             margin-bottom: 15px;
             align-items: center;
-        }}
-        .sankey-controls label {{
+        }
+        .sankey-controls label {
             display: flex;
             align-items: center;
             gap: 5px;
             cursor: pointer;
-        }}
-        .sankey-controls label.disabled {{
+        }
+        .sankey-controls label.disabled {
             display: none;
-        }}
-        .home-grid {{
+        }
+        .home-grid {
             display: grid;
             grid-template-columns: repeat(3, 1fr);
             gap: 20px;
-        }}
-        .home-card {{
+        }
+        .home-card {
             background: white;
             padding: 20px;
             border-radius: 8px;
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
             cursor: pointer;
             transition: transform 0.2s, box-shadow 0.2s;
-        }}
-        .home-card:hover {{
+        }
+        .home-card:hover {
             transform: translateY(-3px);
             box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-        }}
-        .home-card h3 {{
+        }
+        .home-card h3 {
             margin-bottom: 15px;
             color: #2c5f7c;
-        }}
-        .kart-thumbnail {{
+        }
+        .kart-thumbnail {
             width: 300px;
             border: 2px solid #2c5f7c;
             border-radius: 8px;
             cursor: pointer;
             transition: transform 0.2s;
-        }}
-        .kart-thumbnail:hover {{
+        }
+        .kart-thumbnail:hover {
             transform: scale(1.02);
-        }}
-        .kart-button {{
+        }
+        .kart-button {
             display: inline-block;
             background-color: #2c5f7c;
             color: white;
@@ -491,82 +711,82 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             text-decoration: none;
             border-radius: 4px;
             margin-top: 15px;
-        }}
-        .kart-button:hover {{
+        }
+        .kart-button:hover {
             background-color: #1e4a5f;
-        }}
-        .radio-group {{
+        }
+        .radio-group {
             margin-top: 10px;
-        }}
-        .radio-group label {{
+        }
+        .radio-group label {
             display: flex;
             align-items: center;
             font-weight: normal;
             margin-top: 8px;
             cursor: pointer;
-        }}
-        .radio-group input {{
+        }
+        .radio-group input {
             width: auto;
             margin-right: 8px;
-        }}
-        .filter-hint {{
+        }
+        .filter-hint {
             font-size: 12px;
             color: #666;
             margin-top: 5px;
             font-weight: normal;
-        }}
-        @media (max-width: 900px) {{
-            .container {{
+        }
+        @media (max-width: 900px) {
+            .container {
                 flex-direction: column;
-            }}
-            .sidebar {{
+            }
+            .sidebar {
                 width: 100%;
-            }}
-            .home-grid {{
+            }
+            .home-grid {
                 grid-template-columns: 1fr;
-            }}
-        }}
-        .help-content {{
+            }
+        }
+        .help-content {
             max-width: 800px;
             line-height: 1.6;
-        }}
-        .help-content h2 {{
+        }
+        .help-content h2 {
             color: #2c5f7c;
             margin-bottom: 30px;
             padding-bottom: 10px;
             border-bottom: 2px solid #2c5f7c;
-        }}
-        .help-content section {{
+        }
+        .help-content section {
             background: white;
             padding: 25px;
             border-radius: 8px;
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
             margin-bottom: 20px;
-        }}
-        .help-content h3 {{
+        }
+        .help-content h3 {
             color: #2c5f7c;
             margin-bottom: 15px;
-        }}
-        .help-content ul, .help-content ol {{
+        }
+        .help-content ul, .help-content ol {
             margin-left: 20px;
             margin-top: 10px;
             margin-bottom: 10px;
-        }}
-        .help-content li {{
+        }
+        .help-content li {
             margin-bottom: 8px;
-        }}
-        .help-content p {{
+        }
+        .help-content p {
             margin-bottom: 10px;
-        }}
-        .help-content em {{
+        }
+        .help-content em {
             color: #666;
-        }}
-        .help-content a {{
+        }
+        .help-content a {
             color: #2c5f7c;
-        }}
-        .help-content .contact-section {{
+        }
+        .help-content .contact-section {
             background-color: #e8f4f8;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -590,7 +810,7 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             <label for="strekning-ko">Strekning</label>
             <select id="strekning-ko" multiple onchange="updateKoChart()">
                 <option value="Alle strekninger" selected>Alle strekninger</option>
-                {"".join(f'<option value="{s}">{s}</option>' for s in strekninger_ko if s != 'Alle strekninger')}
+                $strekning_ko_options
             </select>
             <div class="filter-hint">Ctrl+klikk for flervalg</div>
 
@@ -630,7 +850,7 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
 
             <label for="strekning-reiser">Strekning</label>
             <select id="strekning-reiser" onchange="updateReiserChart()">
-                {"".join(f'<option value="{s}"' + (' selected' if s == 'Til Asker sentrum' else '') + f'>{s}</option>' for s in strekninger_reiser)}
+                $strekning_reiser_options
             </select>
 
             <hr>
@@ -651,14 +871,14 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             <h3>Velg filtre</h3>
 
             <label for="omrade-fra">Område fra</label>
-            <select id="omrade-fra" multiple onchange="updateNokkelChart()">
-                {omrade_fra_options}
+            <select id="omrade-fra" multiple onchange="planleggOppdatering(updateNokkelChart)">
+                $omrade_fra_options
             </select>
             <div class="filter-hint">Ctrl+klikk for flervalg</div>
 
             <label for="omrade-til">Område til</label>
-            <select id="omrade-til" multiple onchange="updateNokkelChart()">
-                {omrade_til_options}
+            <select id="omrade-til" multiple onchange="planleggOppdatering(updateNokkelChart)">
+                $omrade_til_options
             </select>
             <div class="filter-hint">Ctrl+klikk for flervalg</div>
 
@@ -666,25 +886,25 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
 
             <label>Vis:</label>
             <div class="radio-group">
-                <label><input type="radio" name="visning-nokkel" value="reiser" checked onchange="updateNokkelChart()"> Reiser</label>
-                <label><input type="radio" name="visning-nokkel" value="co2_sum" onchange="updateNokkelChart()"> CO2-utslipp (sum)</label>
-                <label><input type="radio" name="visning-nokkel" value="co2_per_reise" onchange="updateNokkelChart()"> CO2 per reise</label>
+                <label><input type="radio" name="visning-nokkel" value="reiser" checked onchange="planleggOppdatering(updateNokkelChart)"> Reiser</label>
+                <label><input type="radio" name="visning-nokkel" value="co2_sum" onchange="planleggOppdatering(updateNokkelChart)"> CO2-utslipp (sum)</label>
+                <label><input type="radio" name="visning-nokkel" value="co2_per_reise" onchange="planleggOppdatering(updateNokkelChart)"> CO2 per reise</label>
             </div>
 
             <hr>
 
             <label>Tid på dagen:</label>
             <div class="radio-group">
-                {tid_radios}
+                $tid_radios
             </div>
 
             <hr>
 
             <label>Ukedag/helg:</label>
             <div class="radio-group">
-                <label><input type="radio" name="ukedag-nokkel" value="Alle" checked onchange="updateNokkelChart()"> Alle</label>
-                <label><input type="radio" name="ukedag-nokkel" value="Weekday" onchange="updateNokkelChart()"> Ukedag</label>
-                <label><input type="radio" name="ukedag-nokkel" value="Weekend" onchange="updateNokkelChart()"> Helg</label>
+                <label><input type="radio" name="ukedag-nokkel" value="Alle" checked onchange="planleggOppdatering(updateNokkelChart)"> Alle</label>
+                <label><input type="radio" name="ukedag-nokkel" value="Weekday" onchange="planleggOppdatering(updateNokkelChart)"> Ukedag</label>
+                <label><input type="radio" name="ukedag-nokkel" value="Weekend" onchange="planleggOppdatering(updateNokkelChart)"> Helg</label>
             </div>
         </div>
 
@@ -772,8 +992,8 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
                     </div>
                     <div class="sankey-controls" id="sankey-controls">
                         <span><strong>Vis retning:</strong></span>
-                        <label id="sankey-fra-label"><input type="radio" name="sankey-retning" value="fra" checked onchange="updateSankeyChart()"> Fra valgte områder</label>
-                        <label id="sankey-til-label"><input type="radio" name="sankey-retning" value="til" onchange="updateSankeyChart()"> Til valgte områder</label>
+                        <label id="sankey-fra-label"><input type="radio" name="sankey-retning" value="fra" checked onchange="planleggOppdatering(updateSankeyChart)"> Fra valgte områder</label>
+                        <label id="sankey-til-label"><input type="radio" name="sankey-retning" value="til" onchange="planleggOppdatering(updateSankeyChart)"> Til valgte områder</label>
                     </div>
                     <div id="sankey-chart" style="height: 600px;"></div>
                     <p style="color: #666; font-size: 12px; margin-top: 10px;">Viser topp 10 relasjoner basert på siste 4 kvartaler.</p>
@@ -785,13 +1005,13 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
                 <h2>Kart - Asker sentrum</h2>
                 <p style="margin: 20px 0;">Interaktivt kart som viser trafikkmønstre i Asker sentrum.</p>
 
-                <a href="https://qgiscloud.com/jaleas/Asker_sentrum_cloud/?l=Til%20Asker%20sentrum%20Morgen%2CFra%20Asker%20sentrum%20Ettermiddag!%2CGjennomfart%20Asker%20Syd-Nord%20uE18!%2CGjennomfart%20Asker%20Syd-Nord%20!%2CGjennomfart%20Asker%20Syd-Vest%20!%2CGjennomfart%20Asker%20Syd-Vest%20uE18!%2CKart%20over%20koer!%2CAsker%20sentrum%5B43%5D%2CSoner%20Syd%20Vest%20og%20Nord%5B78%5D!%2CGrey&t=Asker_sentrum_cloud&e=1148232%2C8344108%2C1180532%2C8368683" target="_blank">
+                <a href="$kart_url" target="_blank">
                     <img src="https://raw.githubusercontent.com/wdmkkd6ps4-cmd/Asker-dashbord/main/data/kart_thumbnail.png" class="kart-thumbnail" alt="Kart over Asker">
                 </a>
 
                 <br>
 
-                <a href="https://qgiscloud.com/jaleas/Asker_sentrum_cloud/?l=Til%20Asker%20sentrum%20Morgen%2CFra%20Asker%20sentrum%20Ettermiddag!%2CGjennomfart%20Asker%20Syd-Nord%20uE18!%2CGjennomfart%20Asker%20Syd-Nord%20!%2CGjennomfart%20Asker%20Syd-Vest%20!%2CGjennomfart%20Asker%20Syd-Vest%20uE18!%2CKart%20over%20koer!%2CAsker%20sentrum%5B43%5D%2CSoner%20Syd%20Vest%20og%20Nord%5B78%5D!%2CGrey&t=Asker_sentrum_cloud&e=1148232%2C8344108%2C1180532%2C8368683" target="_blank" class="kart-button">
+                <a href="$kart_url" target="_blank" class="kart-button">
                     🗺️ Åpne interaktivt kart i ny fane
                 </a>
 
@@ -913,48 +1133,204 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
     </div>
 
     <script>
-        // Embedded data
-        const koData = {json.dumps(ko_aggregated, ensure_ascii=False)};
-        const reiserData = {json.dumps(reiser_dict, ensure_ascii=False)};
-        const nokkelData = {json.dumps(nokkel_data, ensure_ascii=False)};
+        // Embedded data (gzip + base64), pakkes ut ved sidelast
+        const koDataB64 = "''')
+
+HTML_TAIL = Template('''";
 
         // Første datoer med data
-        const firstKoDate = '{first_ko_date}';
-        const firstForsinkelserDate = '{first_forsinkelser_date}';
+        const firstKoDate = '$first_ko_date';
+        const firstForsinkelserDate = '$first_forsinkelser_date';
+    </script>
+    <script src="dashboard.js?v=$js_versjon" defer></script>
+</body>
+</html>
+''')
+
+# Selve dashbordkoden skrives til docs/dashboard.js, så nettleseren kan cache den på tvers av
+# dataoppdateringer. Den kjøres (defer) etter de innebygde dataene over.
+DASHBOARD_JS = '''        let koData, reiserData, nokkelData;
+
+        // koData.serier[strekning][tid][variant]; indeksene slås opp én gang når dataene er pakket ut
+        let koStrekningIndeks = {};
+        const KO_DATO = 0, KO_KLOKKESLETT_RAW = 1;
+
+        function koSerie(strekning, tidIdx, variant) {
+            const si = koStrekningIndeks[strekning];
+            const perVariant = si === undefined ? null : koData.serier[si][tidIdx];
+            return perVariant ? perVariant[variant] : null;
+        }
+
+        function inflateStream(b64) {
+            // Dataene er gzip-pakket og krever DecompressionStream (mangler f.eks. i Safari før 16.4)
+            if (typeof DecompressionStream === 'undefined') {
+                throw new Error('Nettleseren støtter ikke DecompressionStream');
+            }
+            const bin = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+            return new Response(new Blob([bin]).stream().pipeThrough(new DecompressionStream('gzip')));
+        }
+
+        async function inflate(b64) {
+            return JSON.parse(await inflateStream(b64).text());
+        }
+
+        async function inflateBuffer(b64) {
+            return await inflateStream(b64).arrayBuffer();
+        }
+
+        // Nøkkeltall kommer som parallelle kolonner i en egen binærblob: kategorier som heltallskoder inn i
+        // etikettlistene (omrader_fra, tider, ...) og tallkolonnene som flyttall. oversikt gir type, start og
+        // lengde; hver kolonne får sin egen buffer så den kan overføres til workeren.
+        const TYPEDE_ARRAYS = { int8: Int8Array, int16: Int16Array, int32: Int32Array, float32: Float32Array, float64: Float64Array };
+
+        function typedeKolonner(oversikt, buffer) {
+            const kolonner = {};
+            for (const [navn, k] of Object.entries(oversikt)) {
+                const Type = TYPEDE_ARRAYS[k.type];
+                const verdier = new Type(buffer.slice(k.start, k.start + k.lengde * Type.BYTES_PER_ELEMENT));
+                if (k.delta) {
+                    for (let i = 1; i < verdier.length; i++) verdier[i] += verdier[i - 1];
+                }
+                kolonner[navn] = verdier;
+            }
+            return kolonner;
+        }
+
+        // Utvalgsmaske over kodene til en etikettliste; null betyr at alle er valgt
+        function kodeMaske(etiketter, valgt) {
+            if (valgt === 'Alle') return null;
+            const maske = new Uint8Array(etiketter.length);
+            const kode = etiketter.indexOf(valgt);
+            if (kode >= 0) maske[kode] = 1;
+            return maske;
+        }
+
+        // Går gjennom radene for valgte fra- og til-områder via blokkindeksen (i samme rekkefølge som dataene)
+        let nokkelFraIndeks = new Map(), nokkelTilIndeks = new Map();
+
+        function forEachNokkelRad(omraderFra, omraderTil, fn) {
+            const tilAntall = nokkelData.omrader_til.length;
+            const start = nokkelData.blokk_start;
+            const fraIdx = omraderFra.map(o => nokkelFraIndeks.get(o)).filter(i => i !== undefined).sort((a, b) => a - b);
+            const tilIdx = omraderTil.map(o => nokkelTilIndeks.get(o)).filter(i => i !== undefined).sort((a, b) => a - b);
+            for (const fi of fraIdx) {
+                for (const ti of tilIdx) {
+                    const blokk = fi * tilAntall + ti;
+                    for (let i = start[blokk]; i < start[blokk + 1]; i++) fn(i);
+                }
+            }
+        }
+
+        // DOM-elementene for nøkkeltallfiltrene slås opp én gang (ved DOMContentLoaded)
+        let nokkelDom = null;
+
+        function initNokkelDom() {
+            nokkelDom = {
+                omradeFra: document.getElementById('omrade-fra'),
+                omradeTil: document.getElementById('omrade-til'),
+                tid: document.getElementsByName('tid-nokkel'),
+                ukedag: document.getElementsByName('ukedag-nokkel'),
+                visning: document.getElementsByName('visning-nokkel'),
+                sankeyRetning: document.getElementsByName('sankey-retning'),
+                sankeyBtn: document.getElementById('sankey-btn')
+            };
+        }
+
+        function valgtRadio(radios) {
+            for (const r of radios) {
+                if (r.checked) return r.value;
+            }
+            return null;
+        }
+
+        // Leser filtervalgene for nøkkeltall; brukes av både grafen og Sankey-diagrammet
+        function readSelections() {
+            if (!nokkelDom) initNokkelDom();
+            const fraValg = Array.from(nokkelDom.omradeFra.selectedOptions, o => o.value);
+            const tilValg = Array.from(nokkelDom.omradeTil.selectedOptions, o => o.value);
+            return {
+                fraValg, tilValg,
+                fraAlleValgt: fraValg.includes('Alle') || fraValg.length === 0,
+                tilAlleValgt: tilValg.includes('Alle') || tilValg.length === 0,
+                tid: valgtRadio(nokkelDom.tid),
+                ukedag: valgtRadio(nokkelDom.ukedag),
+                visning: valgtRadio(nokkelDom.visning)
+            };
+        }
+
+        // Slår sammen raske endringer (f.eks. flere klikk i en flervalgsliste) til én omtegning per frame
+        const planlagteOppdateringer = new Set();
+
+        function planleggOppdatering(fn) {
+            if (planlagteOppdateringer.has(fn)) return;
+            planlagteOppdateringer.add(fn);
+            requestAnimationFrame(() => {
+                planlagteOppdateringer.delete(fn);
+                fn();
+            });
+        }
+
+        function settNokkelData(nokkel) {
+            nokkelFraIndeks = new Map(nokkel.omrader_fra.map((o, i) => [o, i]));
+            nokkelTilIndeks = new Map(nokkel.omrader_til.map((o, i) => [o, i]));
+            nokkelData = nokkel;
+        }
+
+        const dataKlar = Promise.all([inflate(koDataB64), inflate(reiserDataB64), inflate(nokkelDataB64), inflateBuffer(nokkelKolonnerB64)])
+            .then(([ko, reiser, nokkel, kolonnerBuffer]) => {
+                koData = ko;
+                koStrekningIndeks = Object.fromEntries(ko.strekninger.map((s, i) => [s, i]));
+                reiserData = reiser;
+                nokkel.kolonner = typedeKolonner(nokkel.kolonner, kolonnerBuffer);
+                settNokkelData(nokkel);
+                nokkelWorker = startNokkelWorker(nokkel);
+            })
+            .catch(feil => {
+                // Uten data forblir alle grafer tomme; vis en synlig melding i stedet for bare en feil i konsollen.
+                // dataKlar løses likevel, og oppdateringsfunksjonene returnerer tidlig fordi dataene mangler.
+                console.error('Kunne ikke pakke ut dashborddataene', feil);
+                const melding = document.createElement('div');
+                melding.setAttribute('role', 'alert');
+                melding.style.cssText = 'background: #f8d7da; color: #721c24; padding: 15px; margin: 10px; border-radius: 4px;';
+                melding.textContent = 'Dataene i dashbordet kunne ikke lastes. Nettleseren kan være for gammel ' +
+                    '(krever støtte for DecompressionStream, f.eks. Safari 16.4 eller nyere). Prøv en oppdatert nettleser.';
+                document.body.prepend(melding);
+            });
 
         // Initialiser startdato ved sidelast
-        document.addEventListener('DOMContentLoaded', function() {{
+        document.addEventListener('DOMContentLoaded', function() {
             initStartdatoFilter();
-        }});
+            initNokkelDom();
+        });
 
-        function initStartdatoFilter() {{
+        function initStartdatoFilter() {
             const visning = document.querySelector('input[name="visning"]:checked').value;
             const startdatoInput = document.getElementById('startdato-ko');
             const hintEl = document.getElementById('startdato-hint');
 
-            if (visning === 'ko') {{
+            if (visning === 'ko') {
                 startdatoInput.min = firstKoDate;
                 startdatoInput.value = firstKoDate;
                 hintEl.textContent = 'Kø-data tilgjengelig fra ' + formatDateNorwegian(firstKoDate);
-            }} else {{
+            } else {
                 startdatoInput.min = firstForsinkelserDate;
                 startdatoInput.value = firstForsinkelserDate;
                 hintEl.textContent = 'Forsinkelser tilgjengelig fra ' + formatDateNorwegian(firstForsinkelserDate);
-            }}
-        }}
+            }
+        }
 
-        function onVisningChange() {{
+        function onVisningChange() {
             initStartdatoFilter();
             updateKoChart();
-        }}
+        }
 
-        function formatDateNorwegian(isoDate) {{
+        function formatDateNorwegian(isoDate) {
             const parts = isoDate.split('-');
             return parts[2] + '.' + parts[1] + '.' + parts[0];
-        }}
+        }
 
         // Navigation
-        function showPage(page) {{
+        function showPage(page) {
             document.querySelectorAll('.page').forEach(p => p.classList.remove('active'));
             document.querySelectorAll('.sidebar').forEach(s => s.style.display = 'none');
             document.querySelectorAll('.nav button').forEach(b => b.classList.remove('active'));
@@ -962,20 +1338,20 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             document.getElementById('page-' + page).classList.add('active');
             event.target.classList.add('active');
 
-            if (page === 'forsinkelser') {{
+            if (page === 'forsinkelser') {
                 document.getElementById('sidebar-forsinkelser').style.display = 'block';
-                updateKoChart();
-            }} else if (page === 'reisestatistikk') {{
+                dataKlar.then(updateKoChart);
+            } else if (page === 'reisestatistikk') {
                 document.getElementById('sidebar-reisestatistikk').style.display = 'block';
-                updateReiserChart();
-            }} else if (page === 'nokkeltall') {{
+                dataKlar.then(updateReiserChart);
+            } else if (page === 'nokkeltall') {
                 document.getElementById('sidebar-nokkeltall').style.display = 'block';
-                updateNokkelChart();
-            }}
-        }}
+                dataKlar.then(updateNokkelChart);
+            }
+        }
 
         // Navigering fra hjem-kort
-        function navigateTo(page) {{
+        function navigateTo(page) {
             document.querySelectorAll('.page').forEach(p => p.classList.remove('active'));
             document.querySelectorAll('.sidebar').forEach(s => s.style.display = 'none');
             document.querySelectorAll('.nav button').forEach(b => b.classList.remove('active'));
@@ -984,26 +1360,28 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
 
             // Finn og marker riktig navigasjonsknapp
             const navButtons = document.querySelectorAll('.nav button');
-            navButtons.forEach(btn => {{
-                if (btn.getAttribute('onclick') === "showPage('" + page + "')") {{
+            navButtons.forEach(btn => {
+                if (btn.getAttribute('onclick') === "showPage('" + page + "')") {
                     btn.classList.add('active');
-                }}
-            }});
+                }
+            });
 
-            if (page === 'forsinkelser') {{
+            if (page === 'forsinkelser') {
                 document.getElementById('sidebar-forsinkelser').style.display = 'block';
-                updateKoChart();
-            }} else if (page === 'reisestatistikk') {{
+                dataKlar.then(updateKoChart);
+            } else if (page === 'reisestatistikk') {
                 document.getElementById('sidebar-reisestatistikk').style.display = 'block';
-                updateReiserChart();
-            }} else if (page === 'nokkeltall') {{
+                dataKlar.then(updateReiserChart);
+            } else if (page === 'nokkeltall') {
                 document.getElementById('sidebar-nokkeltall').style.display = 'block';
-                updateNokkelChart();
-            }}
-        }}
+                dataKlar.then(updateNokkelChart);
+            }
+        }
 
         // Kø/Forsinkelser chart
-        function updateKoChart() {{
+        function updateKoChart() {
+            if (!koData) return;  // dataKlar tegner grafen når dataene er pakket ut
+
             const strekningSelect = document.getElementById('strekning-ko');
             let valgteStrekninger = Array.from(strekningSelect.selectedOptions).map(o => o.value);
             const alleStrekningerValgt = valgteStrekninger.includes('Alle strekninger') || valgteStrekninger.length === 0;
@@ -1011,6 +1389,7 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             const visning = document.querySelector('input[name="visning"]:checked').value;
             const xakse = document.querySelector('input[name="xakse"]:checked').value;
             const tid = document.querySelector('input[name="tid"]:checked').value;
+            const tidIdx = koData.tider.indexOf(tid);
             const startdato = document.getElementById('startdato-ko').value;
 
             const farger = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692', '#B6E880'];
@@ -1019,221 +1398,331 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             // Bestem hvilke strekninger som skal vises
             const strekningerÅVise = alleStrekningerValgt ? ['Alle strekninger'] : valgteStrekninger;
 
-            if (xakse === 'dato') {{
+            if (xakse === 'dato') {
                 // Samle alle unike datoer fra alle valgte strekninger
                 const alleDatoerSet = new Set();
-                const strekningData = {{}};
+                const strekningData = {};
 
-                strekningerÅVise.forEach(strekning => {{
-                    const dataKey = strekning + '_' + tid;
-                    if (!koData[dataKey]) return;
+                strekningerÅVise.forEach(strekning => {
+                    const serie = koSerie(strekning, tidIdx, KO_DATO);
+                    if (!serie) return;
 
-                    const datoerIso = koData[dataKey].datoer_iso;
-                    const alleDatoer = koData[dataKey].datoer;
-                    const alleY = visning === 'ko' ? koData[dataKey].ko : koData[dataKey].forsinkelser;
+                    const datoerIso = serie.datoer_iso;
+                    const alleDatoer = serie.datoer;
+                    const alleY = visning === 'ko' ? serie.ko : serie.forsinkelser;
 
                     // Lag mapping fra ISO-dato til verdi
-                    const datoMap = {{}};
-                    const datoStrMap = {{}};
-                    for (let i = 0; i < datoerIso.length; i++) {{
-                        if (datoerIso[i] >= startdato) {{
+                    const datoMap = {};
+                    const datoStrMap = {};
+                    for (let i = 0; i < datoerIso.length; i++) {
+                        if (datoerIso[i] >= startdato) {
                             alleDatoerSet.add(datoerIso[i]);
                             datoMap[datoerIso[i]] = alleY[i];
                             datoStrMap[datoerIso[i]] = alleDatoer[i];
-                        }}
-                    }}
-                    strekningData[strekning] = {{ datoMap, datoStrMap }};
-                }});
+                        }
+                    }
+                    strekningData[strekning] = { datoMap, datoStrMap };
+                });
 
                 // Sorter alle datoer
                 const sorterteDatoerIso = Array.from(alleDatoerSet).sort();
 
                 // Lag mapping fra ISO til visningsdato (bruk første tilgjengelige)
-                const isoTilVisning = {{}};
-                sorterteDatoerIso.forEach(iso => {{
-                    for (const strekning of strekningerÅVise) {{
-                        if (strekningData[strekning] && strekningData[strekning].datoStrMap[iso]) {{
+                const isoTilVisning = {};
+                sorterteDatoerIso.forEach(iso => {
+                    for (const strekning of strekningerÅVise) {
+                        if (strekningData[strekning] && strekningData[strekning].datoStrMap[iso]) {
                             isoTilVisning[iso] = strekningData[strekning].datoStrMap[iso];
                             break;
-                        }}
-                    }}
-                }});
+                        }
+                    }
+                });
 
                 const xDataFelles = sorterteDatoerIso.map(iso => isoTilVisning[iso]);
 
-                strekningerÅVise.forEach((strekning, idx) => {{
+                strekningerÅVise.forEach((strekning, idx) => {
                     if (!strekningData[strekning]) return;
 
                     const datoMap = strekningData[strekning].datoMap;
                     const yData = sorterteDatoerIso.map(iso => datoMap[iso] !== undefined ? datoMap[iso] : null);
                     const farge = farger[idx % farger.length];
 
-                    if (visning === 'ko') {{
+                    if (visning === 'ko') {
                         // For kø: vis prikker + trendlinje
                         const trend = beregnGlidendeGjennomsnitt(yData, 7);
 
                         // Rådata som punkter (uten legend)
-                        traces.push({{
+                        traces.push({
                             x: xDataFelles,
                             y: yData,
-                            type: 'scatter',
+                            type: markerType(yData),
                             mode: 'markers',
                             name: strekning,
-                            marker: {{ color: farge, size: 5, opacity: 0.6 }},
+                            marker: { color: farge, size: 5, opacity: 0.6 },
                             showlegend: false
-                        }});
+                        });
 
                         // Trendlinje (med legend)
-                        traces.push({{
+                        traces.push({
                             x: xDataFelles,
                             y: trend,
                             type: 'scatter',
                             mode: 'lines',
                             name: strekning,
-                            line: {{ color: farge, width: 2, shape: 'spline', smoothing: 1.0 }},
+                            line: { color: farge, width: 2, shape: 'spline', smoothing: 1.0 },
                             connectgaps: true
-                        }});
-                    }} else {{
+                        });
+                    } else {
                         // For forsinkelser: kun linje
-                        traces.push({{
+                        traces.push({
                             x: xDataFelles,
                             y: yData,
                             type: 'scatter',
                             mode: 'lines',
                             name: strekning,
-                            line: {{ color: farge }},
+                            line: { color: farge },
                             connectgaps: true
-                        }});
-                    }}
-                }});
+                        });
+                    }
+                });
 
                 const yLabel = visning === 'ko' ? 'Kø (min/km)' : 'Forsinkelser (min)';
                 const titleStrekninger = alleStrekningerValgt ? 'alle strekninger' : strekningerÅVise.join(', ').toLowerCase();
                 const title = (visning === 'ko' ? 'Kø' : 'Forsinkelser buss') + ' - ' + titleStrekninger + ' (' + tid.toLowerCase() + ')';
 
-                const layout = {{
-                    title: title,
-                    xaxis: {{ 
-                        title: 'Dato', 
-                        tickangle: -45,
-                        type: 'category'
-                    }},
-                    yaxis: {{ title: yLabel, rangemode: 'tozero' }},
-                    hovermode: 'x unified',
-                    showlegend: !alleStrekningerValgt && strekningerÅVise.length > 1
-                }};
-
-                Plotly.newPlot('ko-chart', traces, layout, {{responsive: true}});
-
-            }} else {{
+                const layout = klargjorLayout(KO_LAYOUT);
+                layout.title = title;
+                layout.xaxis.title = 'Dato';
+                layout.yaxis.title = yLabel;
+                layout.showlegend = !alleStrekningerValgt && strekningerÅVise.length > 1;
+                delete layout.barmode;
+
+                Plotly.react('ko-chart', traces, layout, {responsive: true});
+
+            } else {
                 // Klokkeslett-visning med datofilter
                 // Samle alle unike klokkeslett
                 const alleKlokkeslettSet = new Set();
-                const strekningKlData = {{}};
+                const strekningKlData = {};
 
-                strekningerÅVise.forEach(strekning => {{
-                    const rawKey = strekning + '_' + tid + '_klokkeslett_raw';
-                    if (!koData[rawKey] || !koData[rawKey].records) return;
+                strekningerÅVise.forEach(strekning => {
+                    const serie = koSerie(strekning, tidIdx, KO_KLOKKESLETT_RAW);
+                    if (!serie || !serie.records) return;
 
                     // Filtrer records basert på startdato
-                    const filteredRecords = koData[rawKey].records.filter(r => r.dato_iso >= startdato);
+                    const filteredRecords = serie.records.filter(r => r.dato_iso >= startdato);
 
                     // Aggreger per klokkeslett
-                    const klokkeslettData = {{}};
-                    filteredRecords.forEach(r => {{
+                    const klokkeslettData = {};
+                    filteredRecords.forEach(r => {
                         const kl = r.klokkeslett;
                         alleKlokkeslettSet.add(kl);
                         const val = visning === 'ko' ? r.ko : r.forsinkelser;
-                        if (val !== null) {{
-                            if (!klokkeslettData[kl]) {{
+                        if (val !== null) {
+                            if (!klokkeslettData[kl]) {
                                 klokkeslettData[kl] = [];
-                            }}
+                            }
                             klokkeslettData[kl].push(val);
-                        }}
-                    }});
+                        }
+                    });
 
                     strekningKlData[strekning] = klokkeslettData;
-                }});
+                });
 
                 // Sorter klokkeslett
                 const sorterteKlokkeslett = Array.from(alleKlokkeslettSet).sort();
 
-                strekningerÅVise.forEach((strekning, idx) => {{
+                strekningerÅVise.forEach((strekning, idx) => {
                     if (!strekningKlData[strekning]) return;
 
                     const klokkeslettData = strekningKlData[strekning];
-                    const yData = sorterteKlokkeslett.map(kl => {{
+                    const yData = sorterteKlokkeslett.map(kl => {
                         const vals = klokkeslettData[kl];
                         if (!vals || vals.length === 0) return null;
                         const sum = vals.reduce((a, b) => a + b, 0);
                         return Math.round(sum / vals.length * 1000) / 1000;
-                    }});
+                    });
 
                     const farge = farger[idx % farger.length];
 
-                    traces.push({{
+                    traces.push({
                         x: sorterteKlokkeslett,
                         y: yData,
                         type: 'bar',
                         name: strekning,
-                        marker: {{ color: farge }}
-                    }});
-                }});
+                        marker: { color: farge }
+                    });
+                });
 
                 const yLabel = visning === 'ko' ? 'Kø (min/km)' : 'Forsinkelser (min)';
                 const titleStrekninger = alleStrekningerValgt ? 'alle strekninger' : strekningerÅVise.join(', ').toLowerCase();
                 const title = (visning === 'ko' ? 'Kø' : 'Forsinkelser buss') + ' - ' + titleStrekninger + ' (' + tid.toLowerCase() + ')';
 
-                const layout = {{
-                    title: title,
-                    xaxis: {{ 
-                        title: 'Klokkeslett', 
-                        tickangle: -45,
-                        type: 'category'
-                    }},
-                    yaxis: {{ title: yLabel, rangemode: 'tozero' }},
-                    hovermode: 'x unified',
-                    showlegend: !alleStrekningerValgt && strekningerÅVise.length > 1,
-                    barmode: 'group'
-                }};
-
-                Plotly.newPlot('ko-chart', traces, layout, {{responsive: true}});
-            }}
-        }}
+                const layout = klargjorLayout(KO_LAYOUT);
+                layout.title = title;
+                layout.xaxis.title = 'Klokkeslett';
+                layout.yaxis.title = yLabel;
+                layout.showlegend = !alleStrekningerValgt && strekningerÅVise.length > 1;
+                layout.barmode = 'group';
+
+                Plotly.react('ko-chart', traces, layout, {responsive: true});
+            }
+        }
+
+        // Rå markører tegnes med WebGL når de blir mange; trendlinjene bruker spline og må være SVG
+        const WEBGL_TERSKEL = 1000;
+        // Faste layout-objekter per graf; bare det som endres (titler m.m.) settes før hver Plotly.react
+        const KO_LAYOUT = {
+            title: '',
+            xaxis: { title: '', tickangle: -45, type: 'category' },
+            yaxis: { title: '', rangemode: 'tozero' },
+            hovermode: 'x unified',
+            showlegend: false
+        };
+        const REISER_LAYOUT = {
+            title: '',
+            xaxis: { title: 'Kvartal', tickangle: -45, type: 'category' },
+            yaxis: { title: 'Antall reiser (1000 per kvartal)', rangemode: 'tozero' },
+            hovermode: 'x unified',
+            legend: { title: { text: 'Transportmiddel' } }
+        };
+        const NOKKEL_LAYOUT = {
+            title: '',
+            xaxis: { title: 'Kvartal', tickangle: -45, type: 'category' },
+            yaxis: { title: '', rangemode: 'tozero' },
+            hovermode: 'x unified',
+            legend: { x: 0, y: 1.15, orientation: 'h' },
+            datarevision: 0
+        };
+        const SANKEY_LAYOUT = {
+            title: '',
+            font: { size: 12 },
+            annotations: [
+                { x: 0.0, y: 1.05, text: '<b>Fra</b>', showarrow: false, xref: 'paper', yref: 'paper', font: { color: '#00CC96' } },
+                { x: 1.0, y: 1.05, text: '<b>Til</b>', showarrow: false, xref: 'paper', yref: 'paper', font: { color: '#636EFA' } }
+            ]
+        };
+        const SANKEY_TOM_LAYOUT = {
+            title: 'Ingen data for valgte filtre',
+            annotations: [{
+                text: 'Velg områder i sidemenyen',
+                showarrow: false,
+                font: { size: 16 }
+            }]
+        };
+
+        // Plotly skriver beregnede akseområder (range/autorange) tilbake i layouten; de fjernes så hver
+        // omtegning autoskalerer som med en ny layout
+        function klargjorLayout(layout) {
+            for (const akse of [layout.xaxis, layout.yaxis]) {
+                delete akse.range;
+                delete akse.autorange;
+            }
+            return layout;
+        }
+
+        function markerType(y) {
+            return y.length > WEBGL_TERSKEL ? 'scattergl' : 'scatter';
+        }
+
+        // Rådata-punkter for nøkkeltall og reisestatistikk tynnes ut til høyst så mange punkter
+        // (Largest-Triangle-Three-Buckets); trendlinjene tegnes alltid med alle punkter
+        const LTTB_TERSKEL = 500;
+
+        function tynnUt(x, y) {
+            if (y.length <= LTTB_TERSKEL) return { x, y };
+
+            // Punkter uten verdi tegnes ikke uansett. x-aksen er kategorisk, så posisjonen brukes som x.
+            const idx = [];
+            for (let i = 0; i < y.length; i++) {
+                if (y[i] != null && !isNaN(y[i])) idx.push(i);
+            }
+            const valgt = [];
+            if (idx.length <= LTTB_TERSKEL) {
+                valgt.push(...idx);
+            } else {
+                // Første og siste punkt beholdes; ellers velges punktet i hver bøtte som gir størst trekant
+                // med forrige valgte punkt og gjennomsnittet av neste bøtte
+                const bøtte = (idx.length - 2) / (LTTB_TERSKEL - 2);
+                let forrige = 0;
+                valgt.push(idx[0]);
+                for (let b = 0; b < LTTB_TERSKEL - 2; b++) {
+                    const start = Math.floor(b * bøtte) + 1;
+                    const slutt = Math.floor((b + 1) * bøtte) + 1;
+                    const nesteSlutt = Math.min(Math.floor((b + 2) * bøtte) + 1, idx.length);
+                    let snittX = 0, snittY = 0;
+                    for (let j = slutt; j < nesteSlutt; j++) {
+                        snittX += idx[j];
+                        snittY += y[idx[j]];
+                    }
+                    snittX /= nesteSlutt - slutt;
+                    snittY /= nesteSlutt - slutt;
+
+                    const ax = idx[forrige], ay = y[ax];
+                    let maksAreal = -1;
+                    for (let j = start; j < slutt; j++) {
+                        const areal = Math.abs((ax - snittX) * (y[idx[j]] - ay) - (ax - idx[j]) * (snittY - ay));
+                        if (areal > maksAreal) {
+                            maksAreal = areal;
+                            forrige = j;
+                        }
+                    }
+                    valgt.push(idx[forrige]);
+                }
+                valgt.push(idx[idx.length - 1]);
+            }
+            return { x: valgt.map(i => x[i]), y: valgt.map(i => y[i]) };
+        }
 
         // Funksjon for å beregne sentrert glidende gjennomsnitt
-        function beregnGlidendeGjennomsnitt(values, windowSize) {{
-            const result = [];
+        function beregnGlidendeGjennomsnitt(values, windowSize) {
+            const n = values.length;
+            const result = new Array(n);
             const halfWindow = Math.floor(windowSize / 2);
 
-            for (let i = 0; i < values.length; i++) {{
-                // Beregn start og slutt for vinduet (sentrert)
-                let start = Math.max(0, i - halfWindow);
-                let end = Math.min(values.length - 1, i + halfWindow);
-
-                // Samle verdier i vinduet (ignorer null/undefined)
-                let sum = 0;
-                let count = 0;
-                for (let j = start; j <= end; j++) {{
-                    if (values[j] != null && !isNaN(values[j])) {{
-                        sum += values[j];
-                        count++;
-                    }}
-                }}
+            // Skyvevindu (sentrert): verdien som kommer inn legges til og verdien som faller ut
+            // trekkes fra, null/undefined/NaN telles ikke med. Summen føres kompensert (Neumaier)
+            // så avrundingsfeil ikke hoper seg opp langs serien.
+            let sum = 0;
+            let korreksjon = 0;
+            let count = 0;
+            const leggTil = v => {
+                const t = sum + v;
+                korreksjon += Math.abs(sum) >= Math.abs(v) ? (sum - t) + v : (v - t) + sum;
+                sum = t;
+            };
+            const gyldig = v => v != null && !isNaN(v);
+
+            for (let j = 0; j < Math.min(n, halfWindow); j++) {
+                if (gyldig(values[j])) {
+                    leggTil(values[j]);
+                    count++;
+                }
+            }
+
+            for (let i = 0; i < n; i++) {
+                const inn = i + halfWindow;
+                if (inn < n && gyldig(values[inn])) {
+                    leggTil(values[inn]);
+                    count++;
+                }
+                const ut = i - halfWindow - 1;
+                if (ut >= 0 && gyldig(values[ut])) {
+                    leggTil(-values[ut]);
+                    count--;
+                }
 
                 // Beregn gjennomsnitt hvis vi har minst 1 verdi
-                if (count > 0) {{
-                    result.push(Math.round(sum / count * 100) / 100);
-                }} else {{
-                    result.push(null);
-                }}
-            }}
+                result[i] = count > 0 ? Math.round((sum + korreksjon) / count * 100) / 100 : null;
+            }
 
             return result;
-        }}
+        }
 
         // Reisestatistikk chart
-        function updateReiserChart() {{
+        function updateReiserChart() {
+            if (!reiserData) return;  // dataKlar tegner grafen når dataene er pakket ut
+
             const strekning = document.getElementById('strekning-reiser').value;
             const data = reiserData[strekning];
             if (!data) return;
@@ -1242,444 +1731,421 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             let valgteModi = Array.from(transportmiddelSelect.selectedOptions).map(o => o.value);
             const alleValgt = valgteModi.includes('Alle') || valgteModi.length === 0;
 
-            const colors = {{
+            const colors = {
                 'bil': '#636EFA',
                 'buss': '#EF553B',
                 'sykkel': '#00CC96',
                 'gange': '#AB63FA',
                 'tog': '#FFA15A'
-            }};
+            };
 
-            const labels = {{
+            const labels = {
                 'bil': 'Bil',
                 'buss': 'Buss',
                 'sykkel': 'Sykkel',
                 'gange': 'Gange',
                 'tog': 'Tog'
-            }};
+            };
 
             const alleModi = ['bil', 'buss', 'tog', 'sykkel', 'gange'];
             const traces = [];
 
-            if (alleValgt) {{
+            if (alleValgt) {
                 // Vis kun trendlinjer for alle transportmidler
-                alleModi.forEach(mode => {{
+                alleModi.forEach(mode => {
                     const trend = beregnGlidendeGjennomsnitt(data[mode], 5);
-                    traces.push({{
+                    traces.push({
                         name: labels[mode],
                         x: data.kvartaler,
                         y: trend,
                         type: 'scatter',
                         mode: 'lines',
-                        line: {{ color: colors[mode], width: 2, shape: 'spline', smoothing: 1.0 }},
+                        line: { color: colors[mode], width: 2, shape: 'spline', smoothing: 1.0 },
                         connectgaps: true
-                    }});
-                }});
-            }} else {{
+                    });
+                });
+            } else {
                 // Vis rådata som prikker + trendlinje for valgte modi
-                valgteModi.forEach(mode => {{
+                valgteModi.forEach(mode => {
                     if (mode === 'Alle') return;
 
                     const trend = beregnGlidendeGjennomsnitt(data[mode], 5);
 
                     // Rådata som punkter (uten legend)
-                    traces.push({{
+                    const punkter = tynnUt(data.kvartaler, data[mode]);
+                    traces.push({
                         name: labels[mode],
-                        x: data.kvartaler,
-                        y: data[mode],
-                        type: 'scatter',
+                        x: punkter.x,
+                        y: punkter.y,
+                        type: markerType(punkter.y),
                         mode: 'markers',
-                        marker: {{ color: colors[mode], size: 5, opacity: 0.6 }},
+                        marker: { color: colors[mode], size: 5, opacity: 0.6 },
                         showlegend: false
-                    }});
+                    });
 
                     // Trendlinje (med legend)
-                    traces.push({{
+                    traces.push({
                         name: labels[mode],
                         x: data.kvartaler,
                         y: trend,
                         type: 'scatter',
                         mode: 'lines',
-                        line: {{ color: colors[mode], width: 2, shape: 'spline', smoothing: 1.0 }},
+                        line: { color: colors[mode], width: 2, shape: 'spline', smoothing: 1.0 },
                         connectgaps: true
-                    }});
-                }});
-            }}
+                    });
+                });
+            }
 
             const titleSuffix = alleValgt ? ' - trend' : ' - ' + valgteModi.filter(m => m !== 'Alle').map(m => labels[m]).join(', ');
 
-            const layout = {{
-                title: 'Reisestatistikk - ' + strekning + titleSuffix + ' (1000 reiser per kvartal)',
-                xaxis: {{ title: 'Kvartal', tickangle: -45, type: 'category' }},
-                yaxis: {{ title: 'Antall reiser (1000 per kvartal)', rangemode: 'tozero' }},
-                hovermode: 'x unified',
-                legend: {{ title: {{ text: 'Transportmiddel' }} }}
-            }};
+            const layout = klargjorLayout(REISER_LAYOUT);
+            layout.title = 'Reisestatistikk - ' + strekning + titleSuffix + ' (1000 reiser per kvartal)';
 
-            Plotly.newPlot('reiser-chart', traces, layout, {{responsive: true}});
-        }}
+            Plotly.react('reiser-chart', traces, layout, {responsive: true});
+        }
 
         // Global variabel for CSV-eksport
         let csvExportData = [];
 
-        // Nøkkeltall reiser chart
-        function updateNokkelChart() {{
-            const omradeFraSelect = document.getElementById('omrade-fra');
-            const omradeTilSelect = document.getElementById('omrade-til');
-            const tidNokkel = document.querySelector('input[name="tid-nokkel"]:checked').value;
-            const ukedagNokkel = document.querySelector('input[name="ukedag-nokkel"]:checked').value;
-            const visningNokkel = document.querySelector("input[name='visning-nokkel']:checked").value;
+        // Summer per kvartalkode; funnet markerer kvartalene som har minst én rad
+        function nyKvartalData() {
+            const n = nokkelData.kvartaler.length;
+            return { reiser: new Float64Array(n), co2: new Float64Array(n), funnet: new Uint8Array(n) };
+        }
 
-            // Hent valgte områder (rå valg fra dropdown)
-            let fraValg = Array.from(omradeFraSelect.selectedOptions).map(o => o.value);
-            let tilValg = Array.from(omradeTilSelect.selectedOptions).map(o => o.value);
+        // Avrundede serier per kvartal for alle visninger i én løkke; trend beregnes ETTER aggregering
+        // (kvartalkodene følger kvartalsorteringen, så kvartalene med data tas ut i kodeorden)
+        function kvartalSerier(kvartalData, visningNokkel) {
+            const kvartaler = [];
+            const reiser = [];
+            const co2 = [];
+            const co2PerReise = [];
+            for (let k = 0; k < kvartalData.funnet.length; k++) {
+                if (!kvartalData.funnet[k]) continue;
+                const r = kvartalData.reiser[k];
+                const c = kvartalData.co2[k];
+                kvartaler.push(nokkelData.kvartaler[k]);
+                reiser.push(Math.round(r * 100) / 100);
+                co2.push(Math.round(c * 100) / 100);
+                // CO2 per reise (tonn / 1000 reiser = kg per reise)
+                co2PerReise.push(r > 0 ? Math.round(c / r * 100) / 100 : null);
+            }
+            const reiserTrend = beregnGlidendeGjennomsnitt(reiser, 5);
+            const co2PerReiseTrend = beregnGlidendeGjennomsnitt(co2PerReise, 5);
+
+            // Velg y-verdier basert på visning
+            let yValues, trendValues;
+            if (visningNokkel === 'co2_per_reise') {
+                yValues = co2PerReise;
+                trendValues = co2PerReiseTrend;
+            } else if (visningNokkel === 'co2_sum') {
+                yValues = co2;
+                trendValues = beregnGlidendeGjennomsnitt(co2, 5);
+            } else {
+                yValues = reiser;
+                trendValues = reiserTrend;
+            }
+            return { kvartaler, reiser, co2, co2PerReise, reiserTrend, co2PerReiseTrend, yValues, trendValues };
+        }
 
-            const fraAlleValgt = fraValg.includes('Alle') || fraValg.length === 0;
-            const tilAlleValgt = tilValg.includes('Alle') || tilValg.length === 0;
+        // Lagre for CSV - inkluder både reiser og CO2
+        function leggTilCsvRader(serier, fraTekst, tilTekst) {
+            for (let i = 0; i < serier.kvartaler.length; i++) {
+                csvExportData.push({
+                    område_fra: fraTekst,
+                    område_til: tilTekst,
+                    kvartal: serier.kvartaler[i],
+                    reiser: serier.reiser[i],
+                    reiser_trend: serier.reiserTrend[i],
+                    co2_tonn: serier.co2[i],
+                    co2_per_reise: serier.co2PerReise[i],
+                    co2_per_reise_trend: serier.co2PerReiseTrend[i]
+                });
+            }
+        }
+
+        // Filtrer, aggreger og beregn trend for nøkkeltall. Avhenger bare av valgene og nokkelData,
+        // så den kjøres i nøkkeltall-workeren (og på hovedtråden der Worker ikke finnes).
+        function beregnNokkelSerier(valg) {
+            const { fraValg, tilValg, fraAlleValgt, tilAlleValgt } = valg;
 
             // Bestem hvilke områder som skal brukes for filtrering
-            let omraderFra = fraAlleValgt ? nokkelData.omrader_fra : fraValg;
-            let omraderTil = tilAlleValgt ? nokkelData.omrader_til : tilValg;
+            const omraderFra = fraAlleValgt ? nokkelData.omrader_fra : fraValg;
+            const omraderTil = tilAlleValgt ? nokkelData.omrader_til : tilValg;
 
             // Bestem om vi skal splitte til flere linjer
             // Prioriter fra-områder hvis begge har flervalg
             let splitPå = null;
             let splitOmrader = [];
 
-            if (!fraAlleValgt && fraValg.length > 1) {{
+            if (!fraAlleValgt && fraValg.length > 1) {
                 splitPå = 'fra';
                 splitOmrader = fraValg;
-            }} else if (!tilAlleValgt && tilValg.length > 1) {{
+            } else if (!tilAlleValgt && tilValg.length > 1) {
                 splitPå = 'til';
                 splitOmrader = tilValg;
-            }}
+            }
 
-            // Filtrer data
-            let filtered = nokkelData.records.filter(r => {{
-                const fraMatch = omraderFra.includes(r.delomrade_fra);
-                const tilMatch = omraderTil.includes(r.delomrade_til);
-                const tidMatch = tidNokkel === 'Alle' || r.time_of_day === tidNokkel;
-                const ukedagMatch = ukedagNokkel === 'Alle' || r.weekday_indicator === ukedagNokkel;
-                return fraMatch && tilMatch && tidMatch && ukedagMatch;
-            }});
+            // Filtrer data: bare blokkene for valgte områder leses, tid og ukedag sjekkes per rad
+            const kol = nokkelData.kolonner;
+            const tidMaske = kodeMaske(nokkelData.tider, valg.tid);
+            const ukedagMaske = kodeMaske(nokkelData.ukedager, valg.ukedag);
+            const filtered = [];
+            forEachNokkelRad(omraderFra, omraderTil, i => {
+                if ((tidMaske === null || tidMaske[kol.tid[i]]) && (ukedagMaske === null || ukedagMaske[kol.ukedag[i]])) filtered.push(i);
+            });
+
+            // Aggreger per linje og kvartalkode i én gjennomgang - summer både reiser og CO2. gruppeAv gir
+            // linjen for hver områdekode i omradeKolonne (-1 = ingen); uten omradeKolonne er alt én linje.
+            const aggregerKvartaler = (antallGrupper, omradeKolonne, gruppeAv) => {
+                const grupper = Array.from({ length: antallGrupper }, nyKvartalData);
+                for (const i of filtered) {
+                    const g = omradeKolonne ? gruppeAv[omradeKolonne[i]] : 0;
+                    if (g < 0) continue;
+                    const kvartalData = grupper[g];
+                    const k = kol.kvartal[i];
+                    kvartalData.reiser[k] += kol.reiser[i];
+                    kvartalData.co2[k] += kol.co2[i];
+                    kvartalData.funnet[k] = 1;
+                }
+                return grupper.map(kvartalData => kvartalSerier(kvartalData, valg.visning));
+            };
+
+            // Linjenummer per områdekode for områdene det splittes på
+            const gruppeIndeks = (indeks, antallOmrader) => {
+                const gruppeAv = new Int16Array(antallOmrader).fill(-1);
+                splitOmrader.forEach((omrade, g) => {
+                    const kode = indeks.get(omrade);
+                    if (kode !== undefined) gruppeAv[kode] = g;
+                });
+                return gruppeAv;
+            };
+
+            const fraOmraderTekst = fraAlleValgt ? 'Alle' : fraValg.join(', ');
+            const tilOmraderTekst = tilAlleValgt ? 'Alle' : tilValg.join(', ');
+
+            // Én gruppe per linje (navn i grafen og områdetekster for CSV)
+            if (splitPå === 'fra') {
+                // Flere linjer - én per fra-område
+                const serier = aggregerKvartaler(splitOmrader.length, kol.fra, gruppeIndeks(nokkelFraIndeks, nokkelData.omrader_fra.length));
+                return splitOmrader.map((omrade, g) => ({
+                    navn: omrade, trendNavn: omrade, fra: omrade, til: tilOmraderTekst, serier: serier[g]
+                }));
+            } else if (splitPå === 'til') {
+                // Flere linjer basert på til-områder
+                const serier = aggregerKvartaler(splitOmrader.length, kol.til, gruppeIndeks(nokkelTilIndeks, nokkelData.omrader_til.length));
+                return splitOmrader.map((omrade, g) => ({
+                    navn: omrade, trendNavn: omrade, fra: fraOmraderTekst, til: omrade, serier: serier[g]
+                }));
+            }
+            // Én samlet linje
+            return [{
+                navn: 'Rådata', trendNavn: 'Trend', fra: fraOmraderTekst, til: tilOmraderTekst,
+                serier: aggregerKvartaler(1, null, null)[0]
+            }];
+        }
 
-            const traces = [];
-            csvExportData = [];
-            const farger = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'];
+        // Nøkkeltall-worker: aggregeringen kjører utenfor hovedtråden. Kilden settes sammen av de
+        // samme funksjonene som over, og en kopi av kolonnene overføres til workeren; hovedtråden beholder
+        // sine, så den kan regne selv hvis workeren feiler.
+        let nokkelWorker = null;
+        let nokkelForesporsel = 0;
+        const nokkelVentende = new Map();
+
+        function nokkelWorkerMain() {
+            onmessage = e => {
+                if (e.data.nokkel) {
+                    settNokkelData(e.data.nokkel);
+                    return;
+                }
+                postMessage({ id: e.data.id, grupper: beregnNokkelSerier(e.data.valg) });
+            };
+        }
 
-            if (splitPå === 'fra') {{
-                // Flere linjer - én per fra-område
-                splitOmrader.forEach((omrade, idx) => {{
-                    const omradeFiltered = filtered.filter(r => r.delomrade_fra === omrade);
-
-                    // Aggreger per kvartal - summer både reiser og CO2
-                    const kvartalData = {{}};
-                    omradeFiltered.forEach(r => {{
-                        if (!kvartalData[r.kvartal]) {{
-                            kvartalData[r.kvartal] = {{ reiser: 0, co2: 0 }};
-                        }}
-                        kvartalData[r.kvartal].reiser += r.reiser || 0;
-                        kvartalData[r.kvartal].co2 += r.co2_tonn || 0;
-                    }});
-
-                    const sortedKvartaler = nokkelData.kvartaler.filter(k => kvartalData[k] !== undefined);
-
-                    // Velg y-verdier basert på visning
-                    let yValues;
-                    if (visningNokkel === 'co2_per_reise') {{
-                        // CO2 per reise (tonn / 1000 reiser = kg per reise)
-                        yValues = sortedKvartaler.map(k => {{
-                            const d = kvartalData[k];
-                            if (d.reiser > 0) {{
-                                return Math.round(d.co2 / d.reiser * 100) / 100;
-                            }}
-                            return null;
-                        }});
-                    }} else if (visningNokkel === 'co2_sum') {{
-                        yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].co2 * 100) / 100);
-                    }} else {{
-                        yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].reiser * 100) / 100);
-                    }}
-
-                    // Beregn trend ETTER aggregering
-                    const trendValues = beregnGlidendeGjennomsnitt(yValues, 5);
+        function startNokkelWorker(nokkel) {
+            if (typeof Worker === 'undefined') return null;
+            const funksjoner = [settNokkelData, beregnGlidendeGjennomsnitt, kodeMaske, forEachNokkelRad,
+                                nyKvartalData, kvartalSerier, beregnNokkelSerier];
+            const kilde = 'let nokkelData, nokkelFraIndeks, nokkelTilIndeks;\\n'
+                + funksjoner.map(f => f.toString()).join('\\n')
+                + '\\n(' + nokkelWorkerMain.toString() + ')();';
+            let worker;
+            try {
+                worker = new Worker(URL.createObjectURL(new Blob([kilde], { type: 'text/javascript' })));
+            } catch (e) {
+                return null;  // f.eks. blokkert av sikkerhetsinnstillinger; da regnes det på hovedtråden
+            }
+            worker.onmessage = e => {
+                const ventende = nokkelVentende.get(e.data.id);
+                nokkelVentende.delete(e.data.id);
+                if (ventende) ventende.resolve(e.data.grupper);
+            };
+            worker.onerror = e => {
+                // Feil etter oppstart (f.eks. lasting av blob-en eller en kjøretidsfeil): videre beregninger
+                // og forespørslene som venter kjøres på hovedtråden, og samme valg kan tegnes på nytt
+                console.error('Nøkkeltall-worker feilet, regner på hovedtråden', e);
+                worker.terminate();
+                if (nokkelWorker === worker) nokkelWorker = null;
+                nokkelSignatur = '';
+                for (const { resolve, valg } of nokkelVentende.values()) resolve(beregnNokkelSerier(valg));
+                nokkelVentende.clear();
+            };
+            const kopi = {};
+            for (const [navn, verdier] of Object.entries(nokkel.kolonner)) kopi[navn] = verdier.slice();
+            worker.postMessage({ nokkel: { ...nokkel, kolonner: kopi } }, Object.values(kopi).map(a => a.buffer));
+            return worker;
+        }
 
-                    const farge = farger[idx % farger.length];
+        // Standardvisningen (ingen filtre) er forhåndsaggregert i Python og trenger verken rader eller worker
+        function erStandardvalg(valg) {
+            return valg.fraAlleValgt && valg.tilAlleValgt && valg.tid === 'Alle' && valg.ukedag === 'Alle';
+        }
 
-                    // Rådata som punkter (uten legend)
-                    traces.push({{
-                        x: sortedKvartaler,
-                        y: yValues,
-                        type: 'scatter',
-                        mode: 'markers',
-                        name: omrade,
-                        marker: {{ color: farge, size: 5, opacity: 0.6 }},
-                        showlegend: false
-                    }});
+        function beregnNokkelSerierAsync(valg, id) {
+            if (erStandardvalg(valg)) {
+                return Promise.resolve([{
+                    navn: 'Rådata', trendNavn: 'Trend', fra: 'Alle', til: 'Alle',
+                    serier: kvartalSerier(nokkelData.standard, valg.visning)
+                }]);
+            }
+            if (!nokkelWorker) return Promise.resolve(beregnNokkelSerier(valg));
+            return new Promise(resolve => {
+                nokkelVentende.set(id, { resolve, valg });
+                nokkelWorker.postMessage({ id, valg });
+            });
+        }
 
-                    // Trend som linje
-                    traces.push({{
-                        x: sortedKvartaler,
-                        y: trendValues,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: omrade,
-                        line: {{ color: farge, width: 2, shape: 'spline', smoothing: 1.0 }},
-                        connectgaps: true
-                    }});
-
-                    // Lagre for CSV - inkluder både reiser og CO2
-                    const tilOmraderTekst = tilAlleValgt ? 'Alle' : tilValg.join(', ');
-                    sortedKvartaler.forEach((k, i) => {{
-                        const d = kvartalData[k];
-                        const reiserTrend = beregnGlidendeGjennomsnitt(sortedKvartaler.map(kv => Math.round(kvartalData[kv].reiser * 100) / 100), 5);
-                        const co2PerReise = d.reiser > 0 ? Math.round(d.co2 / d.reiser * 100) / 100 : null;
-                        const co2PerReiseTrend = beregnGlidendeGjennomsnitt(sortedKvartaler.map(kv => {{
-                            const kd = kvartalData[kv];
-                            return kd.reiser > 0 ? Math.round(kd.co2 / kd.reiser * 100) / 100 : null;
-                        }}), 5);
-                        csvExportData.push({{
-                            område_fra: omrade,
-                            område_til: tilOmraderTekst,
-                            kvartal: k,
-                            reiser: Math.round(d.reiser * 100) / 100,
-                            reiser_trend: reiserTrend[i],
-                            co2_tonn: Math.round(d.co2 * 100) / 100,
-                            co2_per_reise: co2PerReise,
-                            co2_per_reise_trend: co2PerReiseTrend[i]
-                        }});
-                    }});
-                }});
-            }} else if (splitPå === 'til') {{
-                // Flere linjer basert på til-områder
-                splitOmrader.forEach((omrade, idx) => {{
-                    const omradeFiltered = filtered.filter(r => r.delomrade_til === omrade);
-
-                    // Aggreger per kvartal
-                    const kvartalData = {{}};
-                    omradeFiltered.forEach(r => {{
-                        if (!kvartalData[r.kvartal]) {{
-                            kvartalData[r.kvartal] = {{ reiser: 0, co2: 0 }};
-                        }}
-                        kvartalData[r.kvartal].reiser += r.reiser || 0;
-                        kvartalData[r.kvartal].co2 += r.co2_tonn || 0;
-                    }});
-
-                    const sortedKvartaler = nokkelData.kvartaler.filter(k => kvartalData[k] !== undefined);
-
-                    // Velg y-verdier basert på visning
-                    let yValues;
-                    if (visningNokkel === 'co2_per_reise') {{
-                        yValues = sortedKvartaler.map(k => {{
-                            const d = kvartalData[k];
-                            if (d.reiser > 0) {{
-                                return Math.round(d.co2 / d.reiser * 100) / 100;
-                            }}
-                            return null;
-                        }});
-                    }} else if (visningNokkel === 'co2_sum') {{
-                        yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].co2 * 100) / 100);
-                    }} else {{
-                        yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].reiser * 100) / 100);
-                    }}
-
-                    // Beregn trend ETTER aggregering
-                    const trendValues = beregnGlidendeGjennomsnitt(yValues, 5);
+        // Filtervalgene grafen sist ble tegnet (eller er under tegning) for
+        let nokkelSignatur = '';
 
-                    const farge = farger[idx % farger.length];
+        // Nøkkeltall reiser chart
+        function updateNokkelChart() {
+            if (!nokkelData) return;  // dataKlar tegner grafen når dataene er pakket ut
+
+            // Hent valgte områder (rå valg fra dropdown) og radioknapper
+            const valg = readSelections();
+
+            // Endringshendelser uten faktisk endring (f.eks. samme valg på nytt) tegner ikke grafen på nytt
+            const signatur = [valg.fraValg.join(','), valg.tilValg.join(','), valg.tid, valg.ukedag, valg.visning].join('|');
+            if (signatur === nokkelSignatur) return;
+            nokkelSignatur = signatur;
+
+            const id = ++nokkelForesporsel;
+            return beregnNokkelSerierAsync(valg, id).then(grupper => {
+                // Svar på en eldre forespørsel tegnes ikke (en nyere er allerede sendt)
+                if (id === nokkelForesporsel) tegnNokkelChart(valg, grupper);
+            });
+        }
 
-                    // Rådata som punkter (uten legend)
-                    traces.push({{
-                        x: sortedKvartaler,
-                        y: yValues,
-                        type: 'scatter',
-                        mode: 'markers',
-                        name: omrade,
-                        marker: {{ color: farge, size: 5, opacity: 0.6 }},
-                        showlegend: false
-                    }});
+        // Gjenbrukte trace-objekter for nøkkeltallgrafen: ett par (punkter, trend) per linje, laget ved behov.
+        // Siden objektene muteres, økes layout.datarevision så Plotly.react ser at dataene er endret.
+        const NOKKEL_FARGER = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'];
+        const nokkelTracePool = [];
+        let nokkelDatarevisjon = 0;
 
+        function nokkelTracePar(idx) {
+            if (!nokkelTracePool[idx]) {
+                const farge = NOKKEL_FARGER[idx % NOKKEL_FARGER.length];
+                nokkelTracePool[idx] = [
+                    // Rådata som punkter (uten legend)
+                    { x: [], y: [], type: 'scatter', mode: 'markers', name: '',
+                      marker: { color: farge, size: 5, opacity: 0.6 }, showlegend: false },
                     // Trend som linje
-                    traces.push({{
-                        x: sortedKvartaler,
-                        y: trendValues,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: omrade,
-                        line: {{ color: farge, width: 2, shape: 'spline', smoothing: 1.0 }},
-                        connectgaps: true
-                    }});
-
-                    // Lagre for CSV
-                    const fraOmraderTekst = fraAlleValgt ? 'Alle' : fraValg.join(', ');
-                    sortedKvartaler.forEach((k, i) => {{
-                        const d = kvartalData[k];
-                        const reiserTrend = beregnGlidendeGjennomsnitt(sortedKvartaler.map(kv => Math.round(kvartalData[kv].reiser * 100) / 100), 5);
-                        const co2PerReise = d.reiser > 0 ? Math.round(d.co2 / d.reiser * 100) / 100 : null;
-                        const co2PerReiseTrend = beregnGlidendeGjennomsnitt(sortedKvartaler.map(kv => {{
-                            const kd = kvartalData[kv];
-                            return kd.reiser > 0 ? Math.round(kd.co2 / kd.reiser * 100) / 100 : null;
-                        }}), 5);
-                        csvExportData.push({{
-                            område_fra: fraOmraderTekst,
-                            område_til: omrade,
-                            kvartal: k,
-                            reiser: Math.round(d.reiser * 100) / 100,
-                            reiser_trend: reiserTrend[i],
-                            co2_tonn: Math.round(d.co2 * 100) / 100,
-                            co2_per_reise: co2PerReise,
-                            co2_per_reise_trend: co2PerReiseTrend[i]
-                        }});
-                    }});
-                }});
-            }} else {{
-                // Én samlet linje
-                const kvartalData = {{}};
-                filtered.forEach(r => {{
-                    if (!kvartalData[r.kvartal]) {{
-                        kvartalData[r.kvartal] = {{ reiser: 0, co2: 0 }};
-                    }}
-                    kvartalData[r.kvartal].reiser += r.reiser || 0;
-                    kvartalData[r.kvartal].co2 += r.co2_tonn || 0;
-                }});
-
-                const sortedKvartaler = nokkelData.kvartaler.filter(k => kvartalData[k] !== undefined);
-
-                // Velg y-verdier basert på visning
-                let yValues;
-                if (visningNokkel === 'co2_per_reise') {{
-                    yValues = sortedKvartaler.map(k => {{
-                        const d = kvartalData[k];
-                        if (d.reiser > 0) {{
-                            return Math.round(d.co2 / d.reiser * 100) / 100;
-                        }}
-                        return null;
-                    }});
-                }} else if (visningNokkel === 'co2_sum') {{
-                    yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].co2 * 100) / 100);
-                }} else {{
-                    yValues = sortedKvartaler.map(k => Math.round(kvartalData[k].reiser * 100) / 100);
-                }}
-
-                // Beregn trend ETTER aggregering
-                const trendValues = beregnGlidendeGjennomsnitt(yValues, 5);
-
-                traces.push({{
-                    x: sortedKvartaler,
-                    y: yValues,
-                    type: 'scatter',
-                    mode: 'markers',
-                    name: 'Rådata',
-                    marker: {{ color: '#636EFA', size: 5, opacity: 0.6 }},
-                    showlegend: false
-                }});
-
-                traces.push({{
-                    x: sortedKvartaler,
-                    y: trendValues,
-                    type: 'scatter',
-                    mode: 'lines',
-                    name: 'Trend',
-                    line: {{ color: '#636EFA', width: 2, shape: 'spline', smoothing: 1.0 }},
-                    connectgaps: true
-                }});
-
-                // Lagre for CSV
-                const fraOmraderTekst = fraAlleValgt ? 'Alle' : fraValg.join(', ');
-                const tilOmraderTekst = tilAlleValgt ? 'Alle' : tilValg.join(', ');
-                const reiserValues = sortedKvartaler.map(k => Math.round(kvartalData[k].reiser * 100) / 100);
-                const reiserTrend = beregnGlidendeGjennomsnitt(reiserValues, 5);
-                const co2PerReiseValues = sortedKvartaler.map(k => {{
-                    const d = kvartalData[k];
-                    return d.reiser > 0 ? Math.round(d.co2 / d.reiser * 100) / 100 : null;
-                }});
-                const co2PerReiseTrend = beregnGlidendeGjennomsnitt(co2PerReiseValues, 5);
-
-                sortedKvartaler.forEach((k, i) => {{
-                    const d = kvartalData[k];
-                    csvExportData.push({{
-                        område_fra: fraOmraderTekst,
-                        område_til: tilOmraderTekst,
-                        kvartal: k,
-                        reiser: reiserValues[i],
-                        reiser_trend: reiserTrend[i],
-                        co2_tonn: Math.round(d.co2 * 100) / 100,
-                        co2_per_reise: co2PerReiseValues[i],
-                        co2_per_reise_trend: co2PerReiseTrend[i]
-                    }});
-                }});
-            }}
+                    { x: [], y: [], type: 'scatter', mode: 'lines', name: '',
+                      line: { color: farge, width: 2, shape: 'spline', smoothing: 1.0 }, connectgaps: true }
+                ];
+            }
+            return nokkelTracePool[idx];
+        }
+
+        function tegnNokkelChart(valg, grupper) {
+            const { fraAlleValgt, tilAlleValgt, visning: visningNokkel } = valg;
+            const traces = [];
+            csvExportData = [];
+
+            grupper.forEach((gruppe, idx) => {
+                const { serier } = gruppe;
+                const [punkter, trend] = nokkelTracePar(idx);
+                const utvalg = tynnUt(serier.kvartaler, serier.yValues);
+                punkter.x = utvalg.x;
+                punkter.y = utvalg.y;
+                punkter.type = markerType(utvalg.y);
+                punkter.name = gruppe.navn;
+                trend.x = serier.kvartaler;
+                trend.y = serier.trendValues;
+                trend.name = gruppe.trendNavn;
+                traces.push(punkter, trend);
+
+                leggTilCsvRader(serier, gruppe.fra, gruppe.til);
+            });
 
             // Dynamisk tittel og y-akse basert på visning
             let titleText, yAxisLabel;
-            if (visningNokkel === 'co2_per_reise') {{
+            if (visningNokkel === 'co2_per_reise') {
                 titleText = 'CO2-utslipp per reise i Asker kommune';
                 yAxisLabel = 'CO2 (kg per reise)';
-            }} else if (visningNokkel === 'co2_sum') {{
+            } else if (visningNokkel === 'co2_sum') {
                 titleText = 'CO2-utslipp i Asker kommune - sum per kvartal';
                 yAxisLabel = 'CO2 (tonn per kvartal)';
-            }} else {{
+            } else {
                 titleText = 'Reisestrømmer i Asker kommune - sum reiser per kvartal';
                 yAxisLabel = 'Antall reiser (1000 per kvartal)';
-            }}
+            }
 
-            const layout = {{
-                title: titleText,
-                xaxis: {{ title: 'Kvartal', tickangle: -45, type: 'category' }},
-                yaxis: {{ title: yAxisLabel, rangemode: 'tozero' }},
-                hovermode: 'x unified',
-                legend: {{ x: 0, y: 1.15, orientation: 'h' }}
-            }};
+            const layout = klargjorLayout(NOKKEL_LAYOUT);
+            layout.title = titleText;
+            layout.yaxis.title = yAxisLabel;
+            layout.datarevision = ++nokkelDatarevisjon;
 
-            Plotly.newPlot('nokkel-chart', traces, layout, {{responsive: true}});
+            Plotly.react('nokkel-chart', traces, layout, {responsive: true});
 
             // Vis/skjul sankey-knapp basert på filter (kun for reiser, ikke CO2)
-            const sankeyBtn = document.getElementById('sankey-btn');
-            if ((fraAlleValgt && tilAlleValgt) || visningNokkel === 'co2_sum' || visningNokkel === 'co2_per_reise') {{
+            const sankeyBtn = nokkelDom.sankeyBtn;
+            if ((fraAlleValgt && tilAlleValgt) || visningNokkel === 'co2_sum' || visningNokkel === 'co2_per_reise') {
                 sankeyBtn.style.display = 'none';
-            }} else {{
+            } else {
                 sankeyBtn.style.display = 'inline-block';
-            }}
-        }}
+            }
+        }
 
         // CSV eksport funksjon
-        function exportCSV() {{
-            if (csvExportData.length === 0) {{
+        function exportCSV() {
+            if (csvExportData.length === 0) {
                 alert('Ingen data å eksportere');
                 return;
-            }}
+            }
 
             // Header med alle kolonner
             const headers = ['Område fra', 'Område til', 'Kvartal', 'Reiser (1000)', 'Reiser trend', 'CO2 (tonn)', 'CO2 per reise (kg)', 'CO2 per reise trend'];
-            const csvContent = [
-                headers.join(';'),
-                ...csvExportData.map(row => [
+            const tall = v => v != null ? String(v).replace('.', ',') : '';
+
+            // Filen bygges som UTF-8-biter per rad (med BOM for Excel) i stedet for én stor streng
+            const encoder = new TextEncoder();
+            const chunks = [new Uint8Array([0xEF, 0xBB, 0xBF]), encoder.encode(headers.join(';'))];
+            for (const row of csvExportData) {
+                chunks.push(encoder.encode('\\n' + [
                     row.område_fra,
                     row.område_til,
                     row.kvartal,
-                    row.reiser != null ? String(row.reiser).replace('.', ',') : '',
-                    row.reiser_trend != null ? String(row.reiser_trend).replace('.', ',') : '',
-                    row.co2_tonn != null ? String(row.co2_tonn).replace('.', ',') : '',
-                    row.co2_per_reise != null ? String(row.co2_per_reise).replace('.', ',') : '',
-                    row.co2_per_reise_trend != null ? String(row.co2_per_reise_trend).replace('.', ',') : ''
-                ].join(';'))
-            ].join('\\n');
-
-            // Last ned fil med UTF-8 BOM for Excel
-            const BOM = '\\uFEFF';
-            const blob = new Blob([BOM + csvContent], {{ type: 'text/csv;charset=utf-8;' }});
+                    tall(row.reiser),
+                    tall(row.reiser_trend),
+                    tall(row.co2_tonn),
+                    tall(row.co2_per_reise),
+                    tall(row.co2_per_reise_trend)
+                ].join(';')));
+            }
+
+            // Last ned fil
+            const blob = new Blob(chunks, { type: 'text/csv;charset=utf-8;' });
             const link = document.createElement('a');
             link.href = URL.createObjectURL(blob);
             link.download = 'reisestrommer_asker.csv';
             link.click();
-        }}
+        }
 
         // Sankey modal funksjoner
-        function openSankeyModal() {{
-            const fraValg = Array.from(document.getElementById('omrade-fra').selectedOptions).map(o => o.value);
-            const tilValg = Array.from(document.getElementById('omrade-til').selectedOptions).map(o => o.value);
-            const fraAlleValgt = fraValg.includes('Alle') || fraValg.length === 0;
-            const tilAlleValgt = tilValg.includes('Alle') || tilValg.length === 0;
+        function openSankeyModal() {
+            const { fraAlleValgt, tilAlleValgt } = readSelections();
 
             const fraLabel = document.getElementById('sankey-fra-label');
             const tilLabel = document.getElementById('sankey-til-label');
@@ -1687,101 +2153,83 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
             const tilRadio = tilLabel.querySelector('input');
 
             // Vis/skjul radioknapper basert på filtervalg
-            if (fraAlleValgt) {{
+            if (fraAlleValgt) {
                 fraLabel.classList.add('disabled');
                 tilLabel.classList.remove('disabled');
                 tilRadio.checked = true;
-            }} else if (tilAlleValgt) {{
+            } else if (tilAlleValgt) {
                 tilLabel.classList.add('disabled');
                 fraLabel.classList.remove('disabled');
                 fraRadio.checked = true;
-            }} else {{
+            } else {
                 fraLabel.classList.remove('disabled');
                 tilLabel.classList.remove('disabled');
-            }}
+            }
 
             document.getElementById('sankey-modal').style.display = 'block';
             updateSankeyChart();
-        }}
+        }
 
-        function closeSankeyModal() {{
+        function closeSankeyModal() {
             document.getElementById('sankey-modal').style.display = 'none';
-        }}
+        }
 
         // Lukk modal ved klikk utenfor
-        window.onclick = function(event) {{
+        window.onclick = function(event) {
             const modal = document.getElementById('sankey-modal');
-            if (event.target === modal) {{
+            if (event.target === modal) {
                 modal.style.display = 'none';
-            }}
-        }}
+            }
+        }
 
-        function updateSankeyChart() {{
-            const omradeFraSelect = document.getElementById('omrade-fra');
-            const omradeTilSelect = document.getElementById('omrade-til');
-            const retning = document.querySelector('input[name="sankey-retning"]:checked').value;
+        // Link-farger for Sankey (fast fargehjul, beregnes én gang)
+        const SANKEY_LINKFARGER = Array.from({ length: 10 }, (_, i) => 'hsla(' + ((i * 50) % 360) + ', 70%, 60%, 0.5)');
 
+        function updateSankeyChart() {
             // Hent valgte områder
-            let omraderFra = Array.from(omradeFraSelect.selectedOptions).map(o => o.value);
-            let omraderTil = Array.from(omradeTilSelect.selectedOptions).map(o => o.value);
-
-            // Sjekk om "Alle" er valgt
-            const fraAlleValgt = omraderFra.includes('Alle') || omraderFra.length === 0;
-            const tilAlleValgt = omraderTil.includes('Alle') || omraderTil.length === 0;
-
-            // Finn siste 4 kvartaler
-            const sisteKvartaler = nokkelData.kvartaler.slice(-4);
-
-            // Filtrer data for siste 4 kvartaler
-            let filtered = nokkelData.records.filter(r => sisteKvartaler.includes(r.kvartal));
-
-            // Aggreger reiser per fra-til kombinasjon
-            const strommer = {{}};
+            const { fraValg: omraderFra, tilValg: omraderTil } = readSelections();
+            const retning = valgtRadio(nokkelDom.sankeyRetning);
+
+            // Topp 10 strømmer per område for siste 4 kvartaler er forhåndsberegnet (sankey_fra/sankey_til);
+            // de valgte områdenes lister slås sammen og sorteres på nytt
+            const strommer = [];
+            const leggTil = (fi, ti, reiser) => strommer.push({
+                fi, ti, fra: nokkelData.omrader_fra[fi], til: nokkelData.omrader_til[ti], reiser
+            });
             let title = '';
 
-            if (retning === 'fra') {{
+            if (retning === 'fra') {
                 // Fra valgte områder til andre
-                filtered.filter(r => omraderFra.includes(r.delomrade_fra)).forEach(r => {{
-                    const key = r.delomrade_fra + '|' + r.delomrade_til;
-                    if (!strommer[key]) {{
-                        strommer[key] = {{ fra: r.delomrade_fra, til: r.delomrade_til, reiser: 0 }};
-                    }}
-                    strommer[key].reiser += r.reiser || 0;
-                }});
+                for (const o of omraderFra) {
+                    const fi = nokkelFraIndeks.get(o);
+                    if (fi !== undefined) nokkelData.sankey_fra[fi].forEach(([ti, reiser]) => leggTil(fi, ti, reiser));
+                }
                 title = 'Reiser FRA valgte områder (topp 10 destinasjoner)';
-            }} else {{
+            } else {
                 // Fra andre til valgte områder
-                filtered.filter(r => omraderTil.includes(r.delomrade_til)).forEach(r => {{
-                    const key = r.delomrade_fra + '|' + r.delomrade_til;
-                    if (!strommer[key]) {{
-                        strommer[key] = {{ fra: r.delomrade_fra, til: r.delomrade_til, reiser: 0 }};
-                    }}
-                    strommer[key].reiser += r.reiser || 0;
-                }});
+                for (const o of omraderTil) {
+                    const ti = nokkelTilIndeks.get(o);
+                    if (ti !== undefined) nokkelData.sankey_til[ti].forEach(([fi, reiser]) => leggTil(fi, ti, reiser));
+                }
                 title = 'Reiser TIL valgte områder (topp 10 opprinnelser)';
-            }}
+            }
 
             // Sorter og ta topp 10
-            const topp10 = Object.values(strommer)
-                .sort((a, b) => b.reiser - a.reiser)
+            const topp10 = strommer
+                .sort((a, b) => (b.reiser - a.reiser) || (a.fi - b.fi) || (a.ti - b.ti))
                 .slice(0, 10);
 
-            if (topp10.length === 0) {{
-                Plotly.newPlot('sankey-chart', [], {{
-                    title: 'Ingen data for valgte filtre',
-                    annotations: [{{
-                        text: 'Velg områder i sidemenyen',
-                        showarrow: false,
-                        font: {{ size: 16 }}
-                    }}]
-                }});
+            if (topp10.length === 0) {
+                Plotly.react('sankey-chart', [], SANKEY_TOM_LAYOUT);
                 return;
-            }}
+            }
 
             // Bygg Sankey-data
             const fraLabels = [...new Set(topp10.map(d => d.fra))];
             const tilLabels = [...new Set(topp10.map(d => d.til))];
             const alleLabels = [...fraLabels, ...tilLabels];
+            const fraNode = new Map(fraLabels.map((l, i) => [l, i]));
+            const tilNode = new Map(tilLabels.map((l, i) => [l, fraLabels.length + i]));
 
             // Farger - grønn for fra, blå for til
             const colors = [
@@ -1789,65 +2237,125 @@ def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_dat
                 ...tilLabels.map(() => '#636EFA')
             ];
 
-            // Link-data
-            const sources = topp10.map(d => fraLabels.indexOf(d.fra));
-            const targets = topp10.map(d => fraLabels.length + tilLabels.indexOf(d.til));
-            const values = topp10.map(d => Math.round(d.reiser));
-
-            // Link-farger med gradient-effekt
-            const linkColors = topp10.map((d, i) => {{
-                const hue = (i * 50) % 360;
-                return `hsla(${{hue}}, 70%, 60%, 0.5)`;
-            }});
+            // Link-data og link-farger med gradient-effekt i én løkke
+            const n = topp10.length;
+            const sources = new Int32Array(n);
+            const targets = new Int32Array(n);
+            const values = new Int32Array(n);
+            const linkColors = new Array(n);
+            for (let i = 0; i < n; i++) {
+                const d = topp10[i];
+                sources[i] = fraNode.get(d.fra);
+                targets[i] = tilNode.get(d.til);
+                values[i] = Math.round(d.reiser);
+                linkColors[i] = SANKEY_LINKFARGER[i];
+            }
 
-            const trace = {{
+            const trace = {
                 type: 'sankey',
                 orientation: 'h',
-                node: {{
+                node: {
                     pad: 20,
                     thickness: 30,
                     label: alleLabels,
                     color: colors
-                }},
-                link: {{
+                },
+                link: {
                     source: sources,
                     target: targets,
                     value: values,
                     color: linkColors
-                }}
-            }};
-
-            const layout = {{
-                title: title,
-                font: {{ size: 12 }},
-                annotations: [
-                    {{ x: 0.0, y: 1.05, text: '<b>Fra</b>', showarrow: false, xref: 'paper', yref: 'paper', font: {{ color: '#00CC96' }} }},
-                    {{ x: 1.0, y: 1.05, text: '<b>Til</b>', showarrow: false, xref: 'paper', yref: 'paper', font: {{ color: '#636EFA' }} }}
-                ]
-            }};
-
-            Plotly.newPlot('sankey-chart', [trace], layout, {{responsive: true}});
-        }}
-    </script>
-</body>
-</html>
+                }
+            };
+
+            const layout = SANKEY_LAYOUT;
+            layout.title = title;
+
+            Plotly.react('sankey-chart', [trace], layout, {responsive: true});
+        }
 '''
-    return html
+
+# Versjon i script-URL-en, så en ny dashboard.js ikke blir hengende i nettleserens cache
+DASHBOARD_JS_VERSJON = hashlib.sha256(DASHBOARD_JS.encode("utf-8")).hexdigest()[:12]
+
+
+def generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_date, first_forsinkelser_date):
+    """Generer HTML med embedded data og JavaScript, som bytes-biter som kan skrives rett til fil"""
+
+    strekninger_ko = ["Alle strekninger"] + sorted(ko_data["stop_name"].dropna().unique().tolist())
+
+    # Forbered reisedata som dict. Radene er allerede sortert på kvartal, og groupby beholder
+    # rekkefølgen innen hver gruppe; bare de få strekningsnavnene sorteres.
+    reiser_dict = {}
+    for strekning, df_s in reiser_data.groupby("ID"):
+        reiser_dict[strekning] = {
+            "kvartaler": df_s["kvartal"].tolist(),
+            **{col: round_array(df_s[col], 2) for col in REISEMIDLER if col in df_s}
+        }
+    strekninger_reiser = list(reiser_dict)
+
+    # Generer options for strekninger
+    strekning_ko_options = "".join(
+        f'<option value="{s}">{s}</option>' for s in strekninger_ko if s != 'Alle strekninger'
+    )
+    strekning_reiser_options = "".join(
+        f'<option value="{s}"' + (' selected' if s == 'Til Asker sentrum' else '') + f'>{s}</option>'
+        for s in strekninger_reiser
+    )
+
+    # Generer options for flervalg
+    omrade_fra_options = '<option value="Alle" selected>Alle</option>\n' + \
+                         "\n".join(f'<option value="{o}">{o}</option>' for o in nokkel_data["omrader_fra"])
+    omrade_til_options = '<option value="Alle" selected>Alle</option>\n' + \
+                         "\n".join(f'<option value="{o}">{o}</option>' for o in nokkel_data["omrader_til"])
+
+    # Generer radiobuttons for tid på dagen
+    tid_radios = '<label><input type="radio" name="tid-nokkel" value="Alle" checked onchange="planleggOppdatering(updateNokkelChart)"> Alle</label>\n'
+    for tid in sorted(nokkel_data["tider"]):
+        tid_radios += f'<label><input type="radio" name="tid-nokkel" value="{tid}" onchange="planleggOppdatering(updateNokkelChart)"> {tid}</label>\n'
+
+    html_head = HTML_HEAD.substitute(
+        strekning_ko_options=strekning_ko_options,
+        strekning_reiser_options=strekning_reiser_options,
+        omrade_fra_options=omrade_fra_options,
+        omrade_til_options=omrade_til_options,
+        tid_radios=tid_radios,
+        kart_url=KART_URL
+    )
+    html_tail = HTML_TAIL.substitute(
+        first_ko_date=first_ko_date,
+        first_forsinkelser_date=first_forsinkelser_date,
+        js_versjon=DASHBOARD_JS_VERSJON
+    )
+
+    # Hver datablob pakkes først når den skal skrives, så bare én ligger i minnet om gangen
+    yield html_head.encode("utf-8")
+    yield pack_json(ko_aggregated)
+    yield b'";\n        const reiserDataB64 = "'
+    yield pack_json(reiser_dict)
+    yield b'";\n        const nokkelDataB64 = "'
+    # Kolonnene går i en egen binærblob; i JSON står bare oversikten over dem. Radene er sortert på
+    # kvartal innen hver (fra, til)-blokk, så kvartalkodene deltakodes.
+    oversikt, kolonner_b64 = pack_kolonner(nokkel_data["kolonner"], delta=("kvartal",))
+    yield pack_json({**nokkel_data, "kolonner": oversikt})
+    yield b'";\n        const nokkelKolonnerB64 = "'
+    yield kolonner_b64
+    yield html_tail.encode("utf-8")
 
 
 def main():
     print("Laster kødata...")
-    ko_data = load_and_process_ko_data("data/inndata_asker_ko.csv")
+    ko_data = cached_load("data/inndata_asker_ko.csv", load_and_process_ko_data)
     print(f"  - {len(ko_data)} rader")
     print(f"  - Datoer: {ko_data['dato'].min()} til {ko_data['dato'].max()}")
     print(f"  - Strekninger: {ko_data['stop_name'].nunique()}")
 
     print("\nLaster reisedata...")
-    reiser_data = load_and_process_reiser_data("data/inndata_asker_reiser.csv")
+    reiser_data = cached_load("data/inndata_asker_reiser.csv", load_and_process_reiser_data)
     print(f"  - {len(reiser_data)} rader")
 
     print("\nLaster nøkkeltalldata...")
-    nokkel_df = load_and_process_nokkel_data("data/inndata_asker_nokkel.csv")
+    nokkel_df = cached_load("data/inndata_asker_nokkel.csv", load_and_process_nokkel_data)
     nokkel_data = prepare_nokkel_data(nokkel_df)
     print(f"  - {len(nokkel_df)} rader")
     print(f"  - Områder fra: {len(nokkel_data['omrader_fra'])}")
@@ -1856,7 +2364,7 @@ def main():
 
     print("\nAggregerer kødata...")
     ko_aggregated = aggregate_ko_data(ko_data)
-    print(f"  - {len(ko_aggregated)} datasett generert")
+    print(f"  - {len(ko_aggregated['strekninger'])} strekninger x {len(ko_aggregated['tider'])} tider")
 
     print("\nBeregner første datoer...")
     first_ko_date, first_forsinkelser_date = calculate_first_dates(ko_aggregated)
@@ -1864,16 +2372,25 @@ def main():
     print(f"  - Første forsinkelser-dato: {first_forsinkelser_date}")
 
     print("\nGenererer HTML...")
-    html = generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_date, first_forsinkelser_date)
+    html_chunks = generate_html(ko_data, reiser_data, ko_aggregated, nokkel_data, first_ko_date, first_forsinkelser_date)
 
-    import os
     os.makedirs("docs", exist_ok=True)
 
-    with open("docs/index.html", "w", encoding="utf-8") as f:
-        f.write(html)
-
-    print(f"\nFerdig! Generert: docs/index.html")
-    print(f"Filstørrelse: {len(html) / 1024:.1f} KB")
+    # Forhåndskomprimert kopi for servere som kan levere index.html.gz med Content-Encoding: gzip
+    with open("docs/index.html", "wb") as f, gzip.open("docs/index.html.gz", "wb", compresslevel=9) as fgz:
+        for chunk in html_chunks:
+            f.write(chunk)
+            fgz.write(chunk)
+        html_storrelse = f.tell()
+
+    with open("docs/dashboard.js", "wb") as f, gzip.open("docs/dashboard.js.gz", "wb", compresslevel=9) as fgz:
+        js = DASHBOARD_JS.encode("utf-8")
+        f.write(js)
+        fgz.write(js)
+
+    print(f"\nFerdig! Generert: docs/index.html og docs/dashboard.js (med .gz-kopier)")
+    print(f"Filstørrelse: {html_storrelse / 1024:.1f} KB (+ {len(js) / 1024:.1f} KB JavaScript)")
+    print(f"Komprimert: {os.path.getsize('docs/index.html.gz') / 1024:.1f} KB")
     print("\nFor å publisere på GitHub Pages:")
     print("1. git add docs/")
     print("2. git commit -m 'Oppdatert dashboard'")
@@ -1,17 +1,49 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import pyarrow.parquet as pq
 import os
 
 # Finn riktig sti til data-mappen
 # I Snowflake ligger filene relativt til appens rotmappe
 DATA_PATH = "data"
 
+# Parquet-kopier av preprosesserte kødata, dagstabellen og klokkeslett-tabellen, skrives ved første innlasting etter at CSV-en er endret
+KO_CSV = f"{DATA_PATH}/inndata_asker_ko.csv"
+KO_PARQUET = f"{DATA_PATH}/cache/app_inndata_asker_ko.parquet"
+KO_DAGLIG_PARQUET = f"{DATA_PATH}/cache/app_inndata_asker_ko_daglig.parquet"
+KO_KLOKKESLETT_PARQUET = f"{DATA_PATH}/cache/app_inndata_asker_ko_klokkeslett.parquet"
+
+# Kolonner i kødataene som brukes (resten av CSV-en leses ikke)
+KO_KOLONNER = ["dato", "klokkeslett", "stop_name", "tid_dag", "ko_min_km", "forsinkelser", "bil"]
+
+# y-kolonne og aksetittel per visning på Forsinkelser-siden
+DIAGRAMMER = {
+    "Kø": ("ko_min_km", "Kø (min/km)"),
+    "Forsinkelser buss": ("forsinkelser", "Forsinkelser (min)"),
+}
+
+# Transportmidlene i reisestatistikken, og fargen hvert av dem tegnes med
+TRANSPORTMIDLER = ["bil", "buss", "sykkel", "gange", "tog"]
+FARGER = {
+    "Bil": "#636EFA",
+    "Buss": "#EF553B",
+    "Sykkel": "#00CC96",
+    "Gange": "#AB63FA",
+    "Tog": "#FFA15A"
+}
+
+# Antall punkter i Over dato-diagrammet der linjene tegnes med WebGL i stedet for SVG
+WEBGL_TERSKEL = 1000
+
+# Kolonnene i dags- og klokkeslett-tabellen med summene bak det bil-vektede gjennomsnittet, per y-kolonne
+VEKTET = {col: (f"{col}_vektet", f"{col}_bil") for col in ["ko_min_km", "forsinkelser"]}
+
 # Sidekonfigurasjon
 st.set_page_config(page_title="Mobilitetsdashbord - Asker", layout="wide")
 
-# Custom CSS for styling
-st.markdown("""
+# Custom CSS for styling. Må sendes på hver kjøring: Streamlit fjerner elementer som ikke tegnes på nytt
+CSS = """
 <style>
     [data-testid="stSidebar"] {
         background-color: #e8e8e8;
@@ -41,48 +73,215 @@ st.markdown("""
         background-color: #4a5a6a;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(CSS, unsafe_allow_html=True)
 
 
 # ========== DATA LOADING ==========
 
-@st.cache_data
-def load_forsinkelser_data():
-    """Last inn og preprosesser kødata"""
+def read_forsinkelser_csv():
+    """Les og preprosesser kødata fra CSV"""
+    # pyarrow-leseren tar bare de brukte kolonnene; dato og klokkeslett leses som tekst og parses nedenfor,
+    # strekning og tid på døgnet leses rett inn som kategorier, så filtrering og gruppering skjer på heltallskoder,
+    # og tallkolonnene leses som float64 (tomme felt blir NaN)
     df = pd.read_csv(
-        f"{DATA_PATH}/inndata_asker_ko.csv",
+        KO_CSV,
         sep=";",
         decimal=",",
-        encoding="utf-8-sig"
+        encoding="utf-8-sig",
+        engine="pyarrow",
+        usecols=KO_KOLONNER,
+        dtype={
+            "dato": "str", "klokkeslett": "str", "stop_name": "category", "tid_dag": "category",
+            "ko_min_km": "float64", "forsinkelser": "float64", "bil": "float64"
+        }
     )
 
-    # Rensk kolonnenavn
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
-    df.columns = df.columns.str.lower()
-
-    # Konverter dato
-    if df["dato"].dtype == 'object' and df["dato"].str.contains(",").any():
-        df["dato"] = df["dato"].str.replace(",", ".")
+    # Konverter dato (formatet bestemmes fra første verdi)
+    gyldige_datoer = df["dato"].dropna()
+    if len(gyldige_datoer) > 0 and "," in gyldige_datoer.iloc[0]:
+        df["dato"] = df["dato"].str.replace(",", ".", regex=False)
         df["dato"] = pd.to_datetime(df["dato"], format="%d.%m.%Y")
     else:
         df["dato"] = pd.to_datetime(df["dato"])
 
-    # Konverter klokkeslett til streng (HH:MM)
-    if "klokkeslett" in df.columns:
-        df["klokkeslett"] = pd.to_datetime(df["klokkeslett"].astype(str)).dt.strftime("%H:%M")
-
-    # Håndter tomme verdier
-    df["forsinkelser"] = pd.to_numeric(df["forsinkelser"], errors="coerce")
-    df["ko_min_km"] = pd.to_numeric(df["ko_min_km"], errors="coerce")
-    if "bil" in df.columns:
-        df["bil"] = pd.to_numeric(df["bil"], errors="coerce")
+    # Konverter klokkeslett til streng (HH:MM), som kategori (kategoriene sorteres kronologisk)
+    df["klokkeslett"] = pd.to_datetime(df["klokkeslett"]).dt.strftime("%H:%M").astype("category")
 
     return df
 
 
+def oppsummert_tabell(df, x_col):
+    """Oppsummer kødata per tid på døgnet, x_col (dato eller klokkeslett) og strekning: median,
+    og summene det bil-vektede gjennomsnittet bygger på"""
+    agg = {"ko_min_km": "median", "forsinkelser": "median"}
+    summer = {}
+    for col, (vektet, bil) in VEKTET.items():
+        gyldig = df[col].notna() & df["bil"].notna()
+        summer[vektet] = (df[col] * df["bil"]).where(gyldig, 0.0)
+        summer[bil] = df["bil"].where(gyldig, 0.0)
+        agg[vektet] = "sum"
+        agg[bil] = "sum"
+    return (
+        df[["tid_dag", x_col, "stop_name", "ko_min_km", "forsinkelser"]]
+        .assign(**summer)
+        .groupby(["tid_dag", x_col, "stop_name"], observed=True)
+        .agg(agg)
+        .reset_index()
+    )
+
+
+def forsinkelser_parquet():
+    """Skriv Parquet-kopiene av kødataene på nytt hvis de mangler eller CSV-en er nyere"""
+    csv_tid = os.path.getmtime(KO_CSV)
+    kopier = [KO_PARQUET, KO_DAGLIG_PARQUET, KO_KLOKKESLETT_PARQUET]
+    if any(not os.path.exists(p) or os.path.getmtime(p) < csv_tid for p in kopier):
+        df = read_forsinkelser_csv()
+        os.makedirs(os.path.dirname(KO_PARQUET), exist_ok=True)
+        df.to_parquet(KO_PARQUET, index=False)
+        oppsummert_tabell(df, "dato").to_parquet(KO_DAGLIG_PARQUET, index=False)
+        oppsummert_tabell(df, "klokkeslett").to_parquet(KO_KLOKKESLETT_PARQUET, index=False)
+
+
+# Kødataene caches som delte objekter (uten kopiering per kall) og må bare leses, ikke endres
+
+@st.cache_resource
+def load_forsinkelser_data():
+    """Last inn kødata (fra Parquet-kopien), med strekningene og første og siste dato til filtrene. Skrivebeskyttet"""
+    forsinkelser_parquet()
+    df = pd.read_parquet(KO_PARQUET)
+    return df, tuple(df["stop_name"].cat.categories), df["dato"].min().date(), df["dato"].max().date()
+
+
+@st.cache_resource
+def load_klokkeslett(tid):
+    """Les klokkeslett-tabellen for én tid på døgnet, med filteret skjøvet ned i Parquet-lesingen. Skrivebeskyttet"""
+    forsinkelser_parquet()
+    return pq.read_table(KO_KLOKKESLETT_PARQUET, filters=[("tid_dag", "=", tid)]).to_pandas()
+
+
+@st.cache_resource
+def load_daglig(tid, start_dato):
+    """Les dagstabellen for én tid på døgnet fra startdato, med filtrene skjøvet ned i Parquet-lesingen.
+    Skrivebeskyttet"""
+    forsinkelser_parquet()
+    filters = [("tid_dag", "=", tid), ("dato", ">=", pd.Timestamp(start_dato))]
+    return pq.read_table(KO_DAGLIG_PARQUET, filters=filters).to_pandas()
+
+
+@st.cache_data
+def compute_filtered(tid_valg, x_akse_valg, start_dato, valgte_strekninger, y_col):
+    """Filtrer og aggreger kødata til diagrammet. Returnerer None hvis det ikke finnes data for filtrene"""
+    # Tid og startdato er allerede filtrert ved lesing.
+    # Over dato brukes dagstabellen med én rad per dato og strekning,
+    # over klokkeslett klokkeslett-tabellen med én rad per klokkeslett og strekning.
+    # Tabellene er skrevet sortert på tid på døgnet, dato/klokkeslett og strekning, så radene er allerede i rekkefølge
+    if x_akse_valg == "Over dato":
+        x_col = "dato"
+        df_tid = load_daglig(tid_valg, start_dato)
+    else:
+        x_col = "klokkeslett"
+        df_tid = load_klokkeslett(tid_valg)
+
+    # Filtrer bort rader uten verdi i y-kolonnen
+    df_tid = df_tid[df_tid[y_col].notna()]
+
+    if len(df_tid) == 0:
+        return None
+
+    if len(valgte_strekninger) == 0:
+        # Vektet gjennomsnitt over alle strekninger per dato eller klokkeslett, fra summene i tabellen
+        vektet, bil = VEKTET[y_col]
+        df_plot = df_tid.groupby(x_col, observed=True)[[vektet, bil]].sum().reset_index()
+        df_plot[y_col] = df_plot[vektet] / df_plot[bil]
+        df_plot["strekning"] = "Alle strekninger"
+    else:
+        # Median per dato eller klokkeslett og strekning (ferdig beregnet i tabellen)
+        df_plot = df_tid[df_tid["stop_name"].isin(valgte_strekninger)][[x_col, "stop_name", y_col]]
+        df_plot = df_plot.rename(columns={"stop_name": "strekning"}).reset_index(drop=True)
+
+    if x_akse_valg == "Over dato":
+        # Formater bare de unike datoene i resultatet, og slå opp resten
+        unike_datoer = df_plot["dato"].drop_duplicates()
+        df_plot["dato_str"] = df_plot["dato"].map(dict(zip(unike_datoer, unike_datoer.dt.strftime("%d.%m.%Y"))))
+
+    return df_plot
+
+
+@st.cache_data
+def build_fig(tid_valg, x_akse_valg, start_dato, valgte_strekninger, diagram_valg):
+    """Lag diagrammet for Forsinkelser-siden fra de aggregerte dataene"""
+    y_col, y_label = DIAGRAMMER[diagram_valg]
+    df_plot = compute_filtered(tid_valg, x_akse_valg, start_dato, valgte_strekninger, y_col)
+
+    if len(valgte_strekninger) == 0:
+        tittel_suffix = f"alle strekninger ({tid_valg.lower()})"
+    else:
+        tittel_suffix = f"utvalgte strekninger ({tid_valg.lower()})"
+    tittel = f"{diagram_valg} - {tittel_suffix}"
+
+    # ===== OVER DATO =====
+    if x_akse_valg == "Over dato":
+        fig = px.line(
+            df_plot,
+            x="dato_str",
+            y=y_col,
+            color="strekning",
+            title=tittel,
+            labels={"dato_str": "Dato", y_col: y_label, "strekning": "Strekning"},
+            render_mode="webgl" if len(df_plot) > WEBGL_TERSKEL else "svg"
+        )
+        fig.update_layout(
+            xaxis_title="Dato",
+            yaxis_title=y_label,
+            hovermode="x unified",
+            xaxis_tickangle=-45,
+            yaxis_rangemode="tozero"
+        )
+
+    # ===== OVER KLOKKESLETT =====
+    else:
+        fig = px.bar(
+            df_plot,
+            x="klokkeslett",
+            y=y_col,
+            color="strekning",
+            barmode="group",
+            title=tittel,
+            labels={"klokkeslett": "Klokkeslett", y_col: y_label, "strekning": "Strekning"}
+        )
+        fig.update_layout(
+            xaxis_title="Klokkeslett",
+            yaxis_title=y_label,
+            hovermode="x unified",
+            yaxis_rangemode="tozero"
+        )
+
+    return fig
+
+
+@st.cache_data
+def make_csv(tid_valg, x_akse_valg, start_dato, valgte_strekninger, diagram_valg):
+    """Lag CSV-eksporten for Forsinkelser-siden fra de aggregerte dataene"""
+    y_col, y_label = DIAGRAMMER[diagram_valg]
+    df_plot = compute_filtered(tid_valg, x_akse_valg, start_dato, valgte_strekninger, y_col)
+
+    if x_akse_valg == "Over dato":
+        export_df = df_plot[["dato_str", "strekning", y_col]].rename(
+            columns={"dato_str": "Dato", "strekning": "Strekning", y_col: y_label}
+        )
+    else:
+        export_df = df_plot[["klokkeslett", "strekning", y_col]].rename(
+            columns={"klokkeslett": "Klokkeslett", "strekning": "Strekning", y_col: y_label}
+        )
+
+    return export_df.to_csv(index=False, sep=";", decimal=",").encode("utf-8")
+
+
 @st.cache_data
 def load_reisestatistikk_data():
-    """Last inn og preprosesser reisestatistikk-data"""
+    """Last inn og preprosesser reisestatistikk-data. Returnerer dataene, de samme dataene i lang format
+    til diagrammet og de sorterte ID-verdiene til filteret"""
     df = pd.read_csv(
         f"{DATA_PATH}/inndata_asker_reiser.csv",
         sep=";",
@@ -91,20 +290,76 @@ def load_reisestatistikk_data():
     )
 
     # Rensk kolonnenavn
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    df.columns = df.columns.str.strip().str.replace('\ufeff', '', regex=False)
 
     # Konverter numeriske kolonner
-    for col in ["bil", "buss", "sykkel", "gange", "tog"]:
+    for col in TRANSPORTMIDLER:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce")
 
-    # Lag sorteringsnøkkel for kvartal (YYYY-Q -> YYYYQ for sortering)
-    df["kvartal_sort"] = df["kvartal"].str.replace("-", "").astype(int)
+    # Lag sorteringsnøkkel for kvartal (YYYY-Q -> YYYYQ for sortering), fra år og kvartal hver for seg
+    df["kvartal_sort"] = df["kvartal"].str[:4].astype("int32") * 10 + df["kvartal"].str[-1].astype("int8")
 
     # Sorter kronologisk
     df = df.sort_values("kvartal_sort").reset_index(drop=True)
 
-    return df
+    # Smelt til lang format én gang, sortert etter kvartal og med penere navn på transportmidler (stor forbokstav)
+    df_long = df.melt(
+        id_vars=["ID", "kvartal", "kvartal_sort"],
+        value_vars=TRANSPORTMIDLER,
+        var_name="Transportmiddel",
+        value_name="Antall reiser"
+    )
+    df_long = df_long.sort_values("kvartal_sort", kind="mergesort").reset_index(drop=True)
+    df_long["Transportmiddel"] = df_long["Transportmiddel"].str.capitalize().astype("category")
+
+    return df, df_long, sorted(df["ID"].unique().tolist())
+
+
+@st.cache_data
+def build_reise_fig(valgt_id):
+    """Lag linjediagrammet for Reisestatistikk-siden for valgt strekning"""
+    _, df_long, _ = load_reisestatistikk_data()
+    df_plot = df_long[df_long["ID"] == valgt_id]
+
+    fig = px.line(
+        df_plot,
+        x="kvartal",
+        y="Antall reiser",
+        color="Transportmiddel",
+        title=f"Reisestatistikk - {valgt_id} (1000 reiser per kvartal)",
+        labels={"kvartal": "Kvartal", "Antall reiser": "Antall reiser (1000 per kvartal)"},
+        color_discrete_map=FARGER
+    )
+
+    fig.update_layout(
+        xaxis_title="Kvartal",
+        yaxis_title="Antall reiser (1000 per kvartal)",
+        hovermode="x unified",
+        xaxis_tickangle=-45,
+        yaxis_rangemode="tozero",
+        legend_title="Transportmiddel",
+        xaxis_type="category"
+    )
+
+    return fig
+
+
+@st.cache_data
+def make_reise_csv(valgt_id):
+    """Lag CSV-eksporten for Reisestatistikk-siden for valgt strekning"""
+    df, _, _ = load_reisestatistikk_data()
+    export_df = df[df["ID"] == valgt_id][["kvartal"] + TRANSPORTMIDLER].rename(
+        columns={
+            "kvartal": "Kvartal",
+            "bil": "Bil",
+            "buss": "Buss",
+            "sykkel": "Sykkel",
+            "gange": "Gange",
+            "tog": "Tog"
+        }
+    )
+    return export_df.to_csv(index=False, sep=";", decimal=",").encode("utf-8")
 
 
 # ========== PAGE: FORSINKELSER ==========
@@ -113,7 +368,7 @@ def page_forsinkelser():
     """Forsinkelser-siden"""
 
     try:
-        df = load_forsinkelser_data()
+        _, alle_strekninger, min_dato, max_dato = load_forsinkelser_data()
     except FileNotFoundError:
         st.error("Kunne ikke finne datafil: data/inndata_asker_ko.csv")
         return
@@ -123,7 +378,6 @@ def page_forsinkelser():
         st.markdown('<div class="sidebar-header">Velg gruppering</div>', unsafe_allow_html=True)
 
         # Multiselect for strekninger
-        alle_strekninger = sorted(df["stop_name"].unique().tolist())
         valgte_strekninger = st.multiselect(
             "Strekning",
             options=alle_strekninger,
@@ -165,8 +419,6 @@ def page_forsinkelser():
         st.markdown("---")
 
         # Dato-velger for startdato (kun relevant for "Over dato")
-        min_dato = df["dato"].min().date()
-        max_dato = df["dato"].max().date()
         start_dato = st.date_input(
             "Startdato",
             value=min_dato,
@@ -176,114 +428,28 @@ def page_forsinkelser():
             disabled=(x_akse_valg == "Over klokkeslett")
         )
 
-    # Filtrer på tid
-    df_tid = df[df["tid_dag"] == tid_valg].copy()
+    # Startdato gjelder bare "Over dato"
+    if x_akse_valg == "Over klokkeslett":
+        start_dato = None
 
-    # Filtrer på startdato (kun for "Over dato")
-    if x_akse_valg == "Over dato":
-        df_tid = df_tid[df_tid["dato"].dt.date >= start_dato]
+    forsinkelser_diagram(tid_valg, x_akse_valg, start_dato, tuple(valgte_strekninger), diagram_valg)
 
+
+@st.fragment
+def forsinkelser_diagram(tid_valg, x_akse_valg, start_dato, valgte_strekninger, diagram_valg):
+    """Diagram og eksport på Forsinkelser-siden. Kjøres som fragment, så eksportknappen ikke kjører hele appen på nytt"""
     # Velg y-kolonne
-    if diagram_valg == "Kø":
-        y_col = "ko_min_km"
-        y_label = "Kø (min/km)"
-    else:
-        y_col = "forsinkelser"
-        y_label = "Forsinkelser (min)"
+    y_col, y_label = DIAGRAMMER[diagram_valg]
 
-    # Filtrer bort rader uten verdi i y-kolonnen
-    df_tid = df_tid[df_tid[y_col].notna()]
+    # Filtrer og aggreger (cachet per filtervalg)
+    df_plot = compute_filtered(tid_valg, x_akse_valg, start_dato, valgte_strekninger, y_col)
 
-    if len(df_tid) == 0:
+    if df_plot is None:
         st.warning("Ingen data tilgjengelig for valgte filtre.")
         return
 
-    # ===== OVER DATO =====
-    if x_akse_valg == "Over dato":
-        df_tid["dato_str"] = df_tid["dato"].dt.strftime("%d.%m.%Y")
-
-        if len(valgte_strekninger) == 0:
-            # Vektet gjennomsnitt over alle strekninger og klokkeslett per dato
-            def weighted_avg(group):
-                mask = group[y_col].notna() & group["bil"].notna()
-                if mask.sum() == 0:
-                    return pd.NA
-                return (group.loc[mask, y_col] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-            df_plot = df_tid.groupby(["dato", "dato_str"]).apply(weighted_avg).reset_index(name=y_col)
-            df_plot["strekning"] = "Alle strekninger"
-            tittel_suffix = f"alle strekninger ({tid_valg.lower()})"
-        else:
-            # Median over klokkeslett per dato og strekning
-            df_plot = df_tid[df_tid["stop_name"].isin(valgte_strekninger)].groupby(
-                ["dato", "dato_str", "stop_name"]
-            ).agg({
-                y_col: "median"
-            }).reset_index()
-            df_plot = df_plot.rename(columns={"stop_name": "strekning"})
-            tittel_suffix = f"utvalgte strekninger ({tid_valg.lower()})"
-
-        df_plot = df_plot.sort_values("dato").reset_index(drop=True)
-        tittel = f"{diagram_valg} - {tittel_suffix}"
-
-        fig = px.line(
-            df_plot,
-            x="dato_str",
-            y=y_col,
-            color="strekning",
-            title=tittel,
-            labels={"dato_str": "Dato", y_col: y_label, "strekning": "Strekning"}
-        )
-        fig.update_layout(
-            xaxis_title="Dato",
-            yaxis_title=y_label,
-            hovermode="x unified",
-            xaxis_tickangle=-45,
-            yaxis_rangemode="tozero"
-        )
-
-    # ===== OVER KLOKKESLETT =====
-    else:
-        if len(valgte_strekninger) == 0:
-            # Vektet gjennomsnitt over alle strekninger og datoer per klokkeslett
-            def weighted_avg(group):
-                mask = group[y_col].notna() & group["bil"].notna()
-                if mask.sum() == 0:
-                    return pd.NA
-                return (group.loc[mask, y_col] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-            df_plot = df_tid.groupby("klokkeslett").apply(weighted_avg).reset_index(name=y_col)
-            df_plot["strekning"] = "Alle strekninger"
-            tittel_suffix = f"alle strekninger ({tid_valg.lower()})"
-        else:
-            # Median over datoer per klokkeslett og strekning
-            df_plot = df_tid[df_tid["stop_name"].isin(valgte_strekninger)].groupby(
-                ["klokkeslett", "stop_name"]
-            ).agg({
-                y_col: "median"
-            }).reset_index()
-            df_plot = df_plot.rename(columns={"stop_name": "strekning"})
-            tittel_suffix = f"utvalgte strekninger ({tid_valg.lower()})"
-
-        # Sorter klokkeslett
-        df_plot = df_plot.sort_values("klokkeslett").reset_index(drop=True)
-        tittel = f"{diagram_valg} - {tittel_suffix}"
-
-        fig = px.bar(
-            df_plot,
-            x="klokkeslett",
-            y=y_col,
-            color="strekning",
-            barmode="group",
-            title=tittel,
-            labels={"klokkeslett": "Klokkeslett", y_col: y_label, "strekning": "Strekning"}
-        )
-        fig.update_layout(
-            xaxis_title="Klokkeslett",
-            yaxis_title=y_label,
-            hovermode="x unified",
-            yaxis_rangemode="tozero"
-        )
+    # Figuren caches per filtervalg og visning
+    fig = build_fig(tid_valg, x_akse_valg, start_dato, valgte_strekninger, diagram_valg)
 
     # Vis diagram
     st.plotly_chart(fig, use_container_width=True)
@@ -292,19 +458,9 @@ def page_forsinkelser():
     st.markdown("---")
     col1, col2 = st.columns([1, 4])
     with col1:
-        if x_akse_valg == "Over dato":
-            export_df = df_plot[["dato_str", "strekning", y_col]].rename(
-                columns={"dato_str": "Dato", "strekning": "Strekning", y_col: y_label}
-            )
-        else:
-            export_df = df_plot[["klokkeslett", "strekning", y_col]].rename(
-                columns={"klokkeslett": "Klokkeslett", "strekning": "Strekning", y_col: y_label}
-            )
-
-        csv = export_df.to_csv(index=False, sep=";", decimal=",").encode("utf-8")
         st.download_button(
             label="📥 Eksporter CSV",
-            data=csv,
+            data=make_csv(tid_valg, x_akse_valg, start_dato, valgte_strekninger, diagram_valg),
             file_name=f"eksport_{diagram_valg.lower().replace(' ', '_')}.csv",
             mime="text/csv",
             key="forsinkelser_eksport"
@@ -354,14 +510,11 @@ def page_reisestatistikk():
     """Reisestatistikk-siden med linjediagram over kvartal"""
 
     try:
-        df = load_reisestatistikk_data()
+        _, df_long, alle_id = load_reisestatistikk_data()
     except FileNotFoundError:
         st.error("Kunne ikke finne datafil: data/inndata_asker_reiser.csv")
         return
 
-    # Hent unike ID-verdier dynamisk fra dataene
-    alle_id = sorted(df["ID"].unique().tolist())
-
     # Finn default-indeks for "Til Asker sentrum"
     default_id = "Til Asker sentrum"
     if default_id in alle_id:
@@ -380,79 +533,24 @@ def page_reisestatistikk():
             key="reisestatistikk_id"
         )
 
-    # Filtrer data på valgt ID
-    df_filtered = df[df["ID"] == valgt_id].copy()
+    # Filtrer data i lang format på valgt ID (allerede sortert etter kvartal)
+    df_plot = df_long[df_long["ID"] == valgt_id]
 
-    if len(df_filtered) == 0:
+    if len(df_plot) == 0:
         st.warning("Ingen data tilgjengelig for valgt strekning.")
         return
 
-    # Forbered data for plotting - smelt til lang format
-    transportmidler = ["bil", "buss", "sykkel", "gange", "tog"]
-    df_plot = df_filtered.melt(
-        id_vars=["kvartal", "kvartal_sort"],
-        value_vars=transportmidler,
-        var_name="Transportmiddel",
-        value_name="Antall reiser"
-    )
-
-    # Sorter etter kvartal
-    df_plot = df_plot.sort_values("kvartal_sort").reset_index(drop=True)
-
-    # Lag penere navn på transportmidler (stor forbokstav)
-    df_plot["Transportmiddel"] = df_plot["Transportmiddel"].str.capitalize()
-
-    # Definer farger for transportmidler
-    farger = {
-        "Bil": "#636EFA",
-        "Buss": "#EF553B",
-        "Sykkel": "#00CC96",
-        "Gange": "#AB63FA",
-        "Tog": "#FFA15A"
-    }
-
-    # Lag linjediagram
-    fig = px.line(
-        df_plot,
-        x="kvartal",
-        y="Antall reiser",
-        color="Transportmiddel",
-        title=f"Reisestatistikk - {valgt_id} (1000 reiser per kvartal)",
-        labels={"kvartal": "Kvartal", "Antall reiser": "Antall reiser (1000 per kvartal)"},
-        color_discrete_map=farger
-    )
-
-    fig.update_layout(
-        xaxis_title="Kvartal",
-        yaxis_title="Antall reiser (1000 per kvartal)",
-        hovermode="x unified",
-        xaxis_tickangle=-45,
-        yaxis_rangemode="tozero",
-        legend_title="Transportmiddel",
-        xaxis_type="category"
-    )
-
-    # Vis diagram
-    st.plotly_chart(fig, use_container_width=True)
+    # Vis diagram (figuren caches per strekning)
+    st.plotly_chart(build_reise_fig(valgt_id), use_container_width=True)
 
     # Eksportmulighet
     st.markdown("---")
     col1, col2 = st.columns([1, 4])
     with col1:
-        export_df = df_filtered[["kvartal"] + transportmidler].rename(
-            columns={
-                "kvartal": "Kvartal",
-                "bil": "Bil",
-                "buss": "Buss",
-                "sykkel": "Sykkel",
-                "gange": "Gange",
-                "tog": "Tog"
-            }
-        )
-        csv = export_df.to_csv(index=False, sep=";", decimal=",").encode("utf-8")
+        # CSV-en caches per strekning; bytes (ikke en funksjon) så knappen også virker på eldre Streamlit
         st.download_button(
             label="📥 Eksporter CSV",
-            data=csv,
+            data=make_reise_csv(valgt_id),
             file_name=f"eksport_reisestatistikk_{valgt_id.lower().replace(' ', '_')}.csv",
             mime="text/csv",
             key="reisestatistikk_eksport"
@@ -515,27 +613,17 @@ def page_forside():
 if "current_page" not in st.session_state:
     st.session_state.current_page = "Hjem"
 
-col1, col2, col3, col4, col5 = st.columns([1, 1, 1, 1, 2])
-with col1:
-    if st.button("Hjem", use_container_width=True,
-                 type="primary" if st.session_state.current_page == "Hjem" else "secondary"):
-        st.session_state.current_page = "Hjem"
-        st.rerun()
-with col2:
-    if st.button("Forsinkelser", use_container_width=True,
-                 type="primary" if st.session_state.current_page == "Forsinkelser" else "secondary"):
-        st.session_state.current_page = "Forsinkelser"
-        st.rerun()
-with col3:
-    if st.button("Reisestatistikk", use_container_width=True,
-                 type="primary" if st.session_state.current_page == "Reisestatistikk" else "secondary"):
-        st.session_state.current_page = "Reisestatistikk"
-        st.rerun()
-with col4:
-    if st.button("Kart", use_container_width=True,
-                 type="primary" if st.session_state.current_page == "Kart" else "secondary"):
-        st.session_state.current_page = "Kart"
-        st.rerun()
+
+def velg_side(side):
+    """Bytt side. Kjøres som callback før skriptet, så knappene og siden tegnes riktig i samme kjøring"""
+    st.session_state.current_page = side
+
+
+for kolonne, side in zip(st.columns([1, 1, 1, 1, 2]), ["Hjem", "Forsinkelser", "Reisestatistikk", "Kart"]):
+    with kolonne:
+        st.button(side, use_container_width=True,
+                  type="primary" if st.session_state.current_page == side else "secondary",
+                  on_click=velg_side, args=(side,))
 
 st.markdown("---")
 
@@ -13,19 +13,18 @@ Output:
 
 import pandas as pd
 import numpy as np
-import json
+import orjson
 from datetime import datetime
 
 
 def load_and_process_ko_data(filepath):
     """Last inn og preprosesser kødata"""
     df = pd.read_csv(filepath, sep=";", decimal=",", encoding="utf-8-sig")
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    df.columns = df.columns.str.strip().str.replace('\ufeff', '', regex=False)
     df.columns = df.columns.str.lower()
 
     # Konverter dato
     df["dato"] = pd.to_datetime(df["dato"])
-    df["dato_str"] = df["dato"].dt.strftime("%d.%m.%Y")
 
     # Håndter numeriske verdier
     df["forsinkelser"] = pd.to_numeric(df["forsinkelser"], errors="coerce")
@@ -38,19 +37,25 @@ def load_and_process_ko_data(filepath):
 def load_and_process_reiser_data(filepath):
     """Last inn og preprosesser reisedata"""
     df = pd.read_csv(filepath, sep=";", decimal=",", encoding="utf-8-sig")
-    df.columns = df.columns.str.strip().str.replace('\ufeff', '')
+    df.columns = df.columns.str.strip().str.replace('\ufeff', '', regex=False)
 
     for col in ["bil", "buss", "sykkel", "gange", "tog"]:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce")
 
     # Lag sorteringsnøkkel
-    df["kvartal_sort"] = df["kvartal"].str.replace("-", "").astype(int)
+    df["kvartal_sort"] = pd.to_numeric(df["kvartal"].str.replace("-", "", regex=False), downcast="integer")
     df = df.sort_values("kvartal_sort").reset_index(drop=True)
 
     return df
 
 
+def round_or_none(s, n=3):
+    """Rund av en serie til n desimaler og erstatt NaN med None (for JSON)"""
+    arr = np.round(s.to_numpy(dtype="float64"), n)
+    return np.where(np.isnan(arr), None, arr.astype(object)).tolist()
+
+
 def aggregate_ko_data(df):
     """Aggreger kødata for grafer"""
     aggregated = {}
@@ -62,82 +67,71 @@ def aggregate_ko_data(df):
             continue
 
         # ===== ALLE STREKNINGER (vektet gjennomsnitt) =====
-        # Per dato - vektet gjennomsnitt
-        def weighted_avg_ko(group):
-            mask = group["ko_min_km"].notna() & group["bil"].notna() & (group["bil"] > 0)
-            if mask.sum() == 0:
-                return np.nan
-            return (group.loc[mask, "ko_min_km"] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-        def weighted_avg_forsinkelser(group):
-            mask = group["forsinkelser"].notna() & group["bil"].notna() & (group["bil"] > 0)
-            if mask.sum() == 0:
-                return np.nan
-            return (group.loc[mask, "forsinkelser"] * group.loc[mask, "bil"]).sum() / group.loc[mask, "bil"].sum()
-
-        # Aggreger per dato for alle strekninger
-        agg_alle_dato = df_tid.groupby("dato").apply(
-            lambda g: pd.Series({
-                "ko_min_km": weighted_avg_ko(g),
-                "forsinkelser": weighted_avg_forsinkelser(g)
-            })
-        ).reset_index()
-        agg_alle_dato = agg_alle_dato.sort_values("dato")
+        # Vekter per rad: bil teller bare der verdien finnes og bil > 0
+        gyldig_bil = df_tid["bil"] > 0
+        df_tid["bil_valid_ko"] = df_tid["bil"].where(df_tid["ko_min_km"].notna() & gyldig_bil, 0)
+        df_tid["bil_valid_fors"] = df_tid["bil"].where(df_tid["forsinkelser"].notna() & gyldig_bil, 0)
+        df_tid["w_ko"] = (df_tid["ko_min_km"] * df_tid["bil"]).where(df_tid["bil_valid_ko"] > 0, 0)
+        df_tid["w_fors"] = (df_tid["forsinkelser"] * df_tid["bil"]).where(df_tid["bil_valid_fors"] > 0, 0)
+
+        # Vektet gjennomsnitt med én groupby-sum i stedet for apply per gruppe (0/0 gir NaN)
+        def weighted_avg(key):
+            sums = df_tid.groupby(key)[["w_ko", "bil_valid_ko", "w_fors", "bil_valid_fors"]].sum()
+            return pd.DataFrame({
+                "ko_min_km": sums["w_ko"] / sums["bil_valid_ko"],
+                "forsinkelser": sums["w_fors"] / sums["bil_valid_fors"]
+            }).reset_index()
+
+        # Aggreger per dato for alle strekninger (groupby sorterer allerede på dato)
+        agg_alle_dato = weighted_avg("dato")
         agg_alle_dato["dato_str"] = agg_alle_dato["dato"].dt.strftime("%d.%m.%Y")
 
         key = f"Alle strekninger_{tid_dag}"
         aggregated[key] = {
             "datoer": agg_alle_dato["dato_str"].tolist(),
-            "ko": [round(x, 3) if pd.notna(x) else None for x in agg_alle_dato["ko_min_km"].tolist()],
-            "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_alle_dato["forsinkelser"].tolist()]
+            "ko": round_or_none(agg_alle_dato["ko_min_km"]),
+            "forsinkelser": round_or_none(agg_alle_dato["forsinkelser"])
         }
 
         # Aggreger per klokkeslett for alle strekninger
-        agg_alle_klokke = df_tid.groupby("klokkeslett").apply(
-            lambda g: pd.Series({
-                "ko_min_km": weighted_avg_ko(g),
-                "forsinkelser": weighted_avg_forsinkelser(g)
-            })
-        ).reset_index()
-        agg_alle_klokke = agg_alle_klokke.sort_values("klokkeslett")
+        agg_alle_klokke = weighted_avg("klokkeslett")
 
         key = f"Alle strekninger_{tid_dag}_klokkeslett"
         aggregated[key] = {
             "klokkeslett": agg_alle_klokke["klokkeslett"].tolist(),
-            "ko": [round(x, 3) if pd.notna(x) else None for x in agg_alle_klokke["ko_min_km"].tolist()],
-            "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_alle_klokke["forsinkelser"].tolist()]
+            "ko": round_or_none(agg_alle_klokke["ko_min_km"]),
+            "forsinkelser": round_or_none(agg_alle_klokke["forsinkelser"])
         }
 
         # ===== PER STREKNING =====
         for stop in df_tid["stop_name"].dropna().unique():
             df_stop = df_tid[df_tid["stop_name"] == stop]
 
-            # Per dato (median per dag)
-            agg = df_stop.groupby(["dato", "dato_str"]).agg({
+            # Per dato (median per dag). groupby sorterer på dato, og dato_str formateres bare for de aggregerte datoene
+            agg = df_stop.groupby("dato").agg({
                 "ko_min_km": "median",
                 "forsinkelser": "median"
             }).reset_index()
-            agg = agg.sort_values("dato")
+            agg["dato_str"] = agg["dato"].dt.strftime("%d.%m.%Y")
 
             key = f"{stop}_{tid_dag}"
             aggregated[key] = {
                 "datoer": agg["dato_str"].tolist(),
-                "ko": [round(x, 3) if pd.notna(x) else None for x in agg["ko_min_km"].tolist()],
-                "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg["forsinkelser"].tolist()]
+                "ko": round_or_none(agg["ko_min_km"]),
+                "forsinkelser": round_or_none(agg["forsinkelser"])
             }
 
-            # Per klokkeslett (median over alle datoer)
+            # Per klokkeslett (median over alle datoer, groupby sorterer på klokkeslett)
             agg_klokke = df_stop.groupby("klokkeslett").agg({
                 "ko_min_km": "median",
                 "forsinkelser": "median"
             }).reset_index()
-            agg_klokke = agg_klokke.sort_values("klokkeslett")
 
             key = f"{stop}_{tid_dag}_klokkeslett"
             aggregated[key] = {
                 "klokkeslett": agg_klokke["klokkeslett"].tolist(),
-                "ko": [round(x, 3) if pd.notna(x) else None for x in agg_klokke["ko_min_km"].tolist()],
-                "forsinkelser": [round(x, 3) if pd.notna(x) else None for x in agg_klokke["forsinkelser"].tolist()]
+                "ko": round_or_none(agg_klokke["ko_min_km"]),
+                "forsinkelser": round_or_none(agg_klokke["forsinkelser"])
             }
 
     return aggregated
@@ -157,11 +151,11 @@ def generate_html(ko_data, reiser_data, ko_aggregated):
         df_s = reiser_data[reiser_data["ID"] == strekning].sort_values("kvartal_sort")
         reiser_dict[strekning] = {
             "kvartaler": df_s["kvartal"].tolist(),
-            "bil": [round(x, 2) if pd.notna(x) else None for x in df_s["bil"].tolist()],
-            "buss": [round(x, 2) if pd.notna(x) else None for x in df_s["buss"].tolist()],
-            "sykkel": [round(x, 2) if pd.notna(x) else None for x in df_s["sykkel"].tolist()],
-            "gange": [round(x, 2) if pd.notna(x) else None for x in df_s["gange"].tolist()],
-            "tog": [round(x, 2) if pd.notna(x) else None for x in df_s["tog"].tolist()]
+            "bil": round_or_none(df_s["bil"], 2),
+            "buss": round_or_none(df_s["buss"], 2),
+            "sykkel": round_or_none(df_s["sykkel"], 2),
+            "gange": round_or_none(df_s["gange"], 2),
+            "tog": round_or_none(df_s["tog"], 2)
         }
 
     html = f'''<!DOCTYPE html>
@@ -464,8 +458,8 @@ def generate_html(ko_data, reiser_data, ko_aggregated):
 
     <script>
         // Embedded data
-        const koData = {json.dumps(ko_aggregated, ensure_ascii=False)};
-        const reiserData = {json.dumps(reiser_dict, ensure_ascii=False)};
+        const koData = {orjson.dumps(ko_aggregated, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()};
+        const reiserData = {orjson.dumps(reiser_dict, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()};
 
         // Navigation
         function showPage(page) {{